@@ -0,0 +1,14 @@
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+
+
+class MarkItUpConfig(AppConfig):
+    name = 'markitup'
+    verbose_name = 'MarkItUp'
+
+    def ready(self):
+        from markitup import settings
+        if settings.MARKITUP_RENDER_STATS:
+            from markitup.stats import render_stats
+            render_stats.connect()
@@ -0,0 +1,167 @@
+"""
+render backends for django-markitup
+
+The MARKITUP_RENDER_BACKEND setting is the dotted path to the class of
+the backend that runs the MARKITUP_FILTER and MARKITUP_PREVIEW_FILTER
+functions, for ``MarkupField``, the template filters and the preview
+views alike:
+
+* ``markitup.backends.InlineBackend`` (the default) calls them in the
+  calling thread.
+
+* ``markitup.backends.ProcessPoolBackend`` sends them to a persistent
+  pool of ``MARKITUP_RENDER_PROCESSES`` worker processes, which import
+  the filter functions when they start. At most
+  ``MARKITUP_RENDER_QUEUE_SIZE`` renders may be queued or running at a
+  time, and a render waits at most ``MARKITUP_RENDER_TIMEOUT`` seconds
+  for a free slot and again for its result, raising ``RenderQueueFull``
+  or ``RenderTimeout`` respectively.
+
+A backend wraps a filter function with ``wrap(func, filter_path,
+filter_kwargs)``, returning the function actually called to render.
+
+"""
+from __future__ import unicode_literals
+
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+
+from markitup import settings
+from markitup.filters import import_filter
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderQueueFull(RenderError):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+class InlineBackend(object):
+    """
+    Renders in the calling thread.
+
+    """
+    def wrap(self, func, filter_path, filter_kwargs=None):
+        return func
+
+
+# filter functions imported by a worker process, by dotted path
+_worker_funcs = {}
+
+
+def _init_worker(filter_paths):
+    django.setup()
+    for filter_path in filter_paths:
+        _worker_funcs[filter_path] = import_filter(filter_path)
+
+
+def _worker_render(filter_path, filter_kwargs, text):
+    try:
+        func = _worker_funcs[filter_path]
+    except KeyError:
+        func = _worker_funcs[filter_path] = import_filter(filter_path)
+    rendered = func(text, **filter_kwargs)
+    if isinstance(rendered, str):
+        return rendered
+    return ''.join(rendered)
+
+
+class PoolRenderFunc(object):
+    """
+    Renders with the filter function at ``filter_path`` in the process
+    pool of ``backend``.
+
+    """
+    def __init__(self, backend, filter_path, filter_kwargs=None):
+        self.backend = backend
+        self.filter_path = filter_path
+        self.filter_kwargs = filter_kwargs or {}
+
+    def __call__(self, text, **kwargs):
+        return self.backend.render(self.filter_path,
+                                   dict(self.filter_kwargs, **kwargs), text)
+
+
+class ProcessPoolBackend(object):
+    """
+    Renders in a persistent pool of worker processes.
+
+    """
+    def __init__(self, processes=None, queue_size=None, timeout=None):
+        self.processes = processes or settings.MARKITUP_RENDER_PROCESSES
+        self.queue_size = queue_size or settings.MARKITUP_RENDER_QUEUE_SIZE
+        self.timeout = (timeout if timeout is not None
+                        else settings.MARKITUP_RENDER_TIMEOUT)
+        self.filter_paths = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+
+    def wrap(self, func, filter_path, filter_kwargs=None):
+        # warm up the filters wrapped before the pool starts
+        self.filter_paths.add(filter_path)
+        return PoolRenderFunc(self, filter_path, filter_kwargs)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.processes, initializer=_init_worker,
+                    initargs=(sorted(self.filter_paths),))
+            return self._executor
+
+    def _submit(self, *args):
+        executor = self._get_executor()
+        try:
+            return executor.submit(_worker_render, *args)
+        except BrokenProcessPool:
+            # a worker died, e.g. killed for using too much memory
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return self._get_executor().submit(_worker_render, *args)
+
+    def render(self, filter_path, filter_kwargs, text):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RenderQueueFull("Too many renders queued.")
+        try:
+            future = self._submit(filter_path, filter_kwargs, text)
+        except Exception:
+            self._slots.release()
+            raise
+        # a render that timed out holds its slot until it finishes
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise RenderTimeout("Render timed out after %s seconds."
+                                % self.timeout)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait)
+
+
+def get_backend(dotted_path=None):
+    """
+    Return a new instance of the backend class at ``dotted_path``, by
+    default the MARKITUP_RENDER_BACKEND setting.
+
+    """
+    return import_filter(dotted_path or settings.MARKITUP_RENDER_BACKEND)()
+
+
+# the backend used by MarkupField, the template filters and the preview
+render_backend = get_backend()
@@ -0,0 +1,327 @@
+"""
+block splitting and rendering for django-markitup
+
+Most of a markup document consists of top-level blocks (paragraphs,
+headers, lists, code blocks...) that render the same whether they are
+rendered on their own or as part of the whole document. This module
+splits Markdown documents into such blocks, and reStructuredText
+documents into top-level sections, so that only the blocks that
+changed need to be rendered again.
+
+Some constructs make the rendering of a block depend on other blocks,
+e.g. reference-style links and footnotes, whose definitions may be
+anywhere in the document. ``split_blocks`` and ``split_sections``
+return the whole document as a single block if it contains any of
+them.
+
+``get_syntax`` tells which of them applies to a filter: sections for
+``markitup.renderers.render_rest``, blocks for the Markdown filters in
+``MARKDOWN_FILTERS``, and none (the whole document is one block) for
+other filters and for Markdown extensions keeping state across the
+document, e.g. the unique header ids of ``toc``.
+
+``BlockRenderer`` wraps a filter function: it renders each block of a
+document through a render cache keyed on the block's content, and
+joins the results. It is used in place of the MARKITUP_FILTER and
+MARKITUP_PREVIEW_FILTER functions when the MARKITUP_RENDER_BLOCKS
+setting is ``True``.
+
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import re
+from collections import namedtuple
+from functools import partial
+
+from markitup import settings
+from markitup.cache import get_render_cache, render_key
+
+REST_FILTER = 'markitup.renderers.render_rest'
+MARKDOWN_FILTERS = ('markdown.markdown', 'markdown2.markdown')
+# Python-Markdown extensions and markdown2 extras whose output depends on
+# the whole document
+STATEFUL_EXTENSIONS = frozenset([
+    'toc', 'attr_list', 'footnotes', 'abbr', 'extra', 'header-ids'])
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_LIST_RE = re.compile(r'^ {0,3}([*+-]|\d+[.)])\s')
+_QUOTE_RE = re.compile(r'^ {0,3}>')
+# link, footnote and abbreviation definitions, tables of contents and
+# raw HTML blocks (which may contain blank lines)
+_CROSS_BLOCK_RE = re.compile(
+    r'^ {0,3}(\*?\[[^\]]+\]:|\[TOC\]\s*$|<[A-Za-z!/])', re.MULTILINE)
+
+
+def block_id(block):
+    """
+    Return a short identifier for the content of ``block``.
+
+    """
+    return hashlib.sha1(block.encode('utf-8')).hexdigest()[:16]
+
+
+def _chunks(lines):
+    """
+    Yield the ``(start, end)`` line ranges of the chunks of ``lines``
+    separated by blank lines outside fenced code.
+
+    """
+    start, fence = None, None
+    for i, line in enumerate(lines):
+        if fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+            if start is None:
+                start = i
+        elif line.strip():
+            if start is None:
+                start = i
+        elif start is not None:
+            yield start, i
+            start = None
+    if start is not None:
+        yield start, len(lines)
+
+
+def _continues(block, chunk):
+    """
+    Return whether ``chunk`` continues the block starting with the chunk
+    ``block`` (e.g. the next item of a loose list).
+
+    """
+    first = chunk[0]
+    if first[:1] in (' ', '\t'):
+        # indented code, or a continuation paragraph of a list item
+        return True
+    if _LIST_RE.match(first) and _LIST_RE.match(block[0]):
+        return True
+    if _QUOTE_RE.match(first) and _QUOTE_RE.match(block[0]):
+        return True
+    return False
+
+
+def split_blocks(text):
+    """
+    Split the Markdown document ``text`` into a list of top-level
+    blocks, or return ``[text]`` if its blocks can't be rendered
+    independently.
+
+    """
+    if _CROSS_BLOCK_RE.search(text):
+        return [text]
+    lines = text.split('\n')
+    # line ranges of the blocks, which keep the blank lines between
+    # their chunks (e.g. in indented code) as they are
+    ranges = []
+    first = None
+    for start, end in _chunks(lines):
+        chunk = lines[start:end]
+        if first is not None and _continues(first, chunk):
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+            first = chunk
+    return ['\n'.join(lines[start:end]) for start, end in ranges]
+
+
+# section adornments, e.g. "=====", and explicit markup or references
+# that depend on the rest of the document
+_ADORNMENT_RE = re.compile(r'^([!-/:-@[-`{-~])\1*\s*$')
+_REST_CROSS_BLOCK_RE = re.compile(
+    r'^\s*\.\. +(_|\[|\||(contents|sectnum|header|footer|title|meta)::)'
+    r'|(`|\w)__?(?!\w)|\[(#|\*|\d+)[^\]]*\]_|\|[^|\s][^|]*\|',
+    re.MULTILINE)
+
+
+def _titles(lines):
+    """
+    Yield ``(start, style, title)`` for the section titles in
+    ``lines``, where ``start`` is the index of the title's first line
+    (its overline, if any) and ``style`` its adornment.
+
+    """
+    for i in range(1, len(lines)):
+        line, title = lines[i], lines[i - 1]
+        match = _ADORNMENT_RE.match(line)
+        if not match or not title.strip() or _ADORNMENT_RE.match(title):
+            continue
+        char = match.group(1)
+        if i >= 2 and lines[i - 2].rstrip() == line.rstrip():
+            yield i - 2, (char, True), title.strip()
+        elif not title[:1].isspace() and (i < 2 or not lines[i - 2].strip()):
+            yield i - 1, (char, False), title.strip()
+
+
+def split_sections(text):
+    """
+    Split the reStructuredText document ``text`` into the text before
+    its first section and its top-level sections, or return ``[text]``
+    if they can't be rendered independently.
+
+    """
+    if _REST_CROSS_BLOCK_RE.search(text):
+        return [text]
+    lines = text.split('\n')
+    titles = list(_titles(lines))
+    if not titles:
+        return [text]
+    # ids are made from titles, and must stay unique
+    ids = [re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')
+           for start, style, title in titles]
+    if len(set(ids)) != len(ids):
+        return [text]
+    # levels are given to styles in order of appearance, so every
+    # section must use them in the order the whole document does
+    styles = []
+    for start, style, title in titles:
+        if style not in styles:
+            styles.append(style)
+    starts = [start for start, style, title in titles if style == styles[0]]
+    section_styles = []
+    for start, style, title in titles:
+        if style == styles[0]:
+            section_styles.append([])
+        if style not in section_styles[-1]:
+            section_styles[-1].append(style)
+    for used in section_styles:
+        if used != styles[:len(used)]:
+            return [text]
+
+    blocks = []
+    for start, end in zip([0] + starts, starts + [len(lines)]):
+        block = '\n'.join(lines[start:end]).strip('\n')
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+_DOCUMENT_START = '<div class="document">\n'
+_DOCUMENT_END = '</div>\n'
+
+
+def unwrap(html, document):
+    """
+    Return the content of ``html`` without the start and end of the
+    ``(start, end)`` element ``document``, or ``None`` if ``html``
+    isn't enclosed in it.
+
+    """
+    start, end = document
+    if html.startswith(start) and html.endswith(end):
+        return html[len(start):len(html) - len(end)]
+    return None
+
+
+def _join_rest(rendered):
+    parts = [unwrap(html, (_DOCUMENT_START, _DOCUMENT_END))
+             for html in rendered]
+    if None in parts:
+        return None
+    return _DOCUMENT_START + ''.join(parts) + _DOCUMENT_END
+
+
+# how to split, render (extra filter arguments) and join blocks, and
+# the element enclosing the joined blocks (if any)
+Syntax = namedtuple('Syntax', 'split extra_kwargs join document')
+
+_SYNTAXES = {
+    'markdown': Syntax(split_blocks, {}, '\n'.join, None),
+    # each section would become the document title otherwise
+    'rest': Syntax(split_sections, {'doctitle_xform': False}, _join_rest,
+                   (_DOCUMENT_START, _DOCUMENT_END)),
+}
+
+
+def _extension_name(extension):
+    # 'toc', 'markdown.extensions.toc', 'markdown.extensions.toc:TocExtension'
+    # or TocExtension()
+    if not isinstance(extension, str):
+        extension = type(extension).__module__
+    return extension.split(':')[0].rsplit('.', 1)[-1]
+
+
+def _is_stateful(filter_kwargs):
+    extensions = list(filter_kwargs.get('extensions') or ())
+    extensions.extend(filter_kwargs.get('extras') or ())
+    return any(_extension_name(extension) in STATEFUL_EXTENSIONS
+               for extension in extensions)
+
+
+def get_syntax(filter_path, filter_kwargs=None):
+    """
+    Return the ``Syntax`` of the documents rendered by the filter
+    function at ``filter_path`` with arguments ``filter_kwargs``, or
+    ``None`` if they can't be rendered block by block.
+
+    """
+    if filter_path == REST_FILTER:
+        return _SYNTAXES['rest']
+    if filter_path in MARKDOWN_FILTERS and not _is_stateful(
+            filter_kwargs or {}):
+        return _SYNTAXES['markdown']
+    return None
+
+
+class BlockRenderer(object):
+    """
+    Renders markup with ``func``, the filter function at
+    ``filter_path`` with arguments ``filter_kwargs``, one block at a
+    time, going through the render cache ``cache`` (if any).
+
+    Documents are split according to ``get_syntax(filter_path,
+    filter_kwargs)``, which must not be ``None``.
+
+    """
+    def __init__(self, func, filter_path, filter_kwargs=None, cache=None):
+        syntax = get_syntax(filter_path, filter_kwargs)
+        if syntax is None:
+            raise ValueError("Can't split the markup of %r into blocks."
+                             % filter_path)
+        self.func = func
+        self.filter_path = filter_path
+        self.cache = cache
+        self.split, extra_kwargs, self.join = syntax[:3]
+        self.block_func = partial(func, **extra_kwargs)
+        self.block_kwargs = dict(filter_kwargs or {}, **extra_kwargs)
+
+    def __call__(self, text):
+        blocks = self.split(text)
+        max_entries = self.cache.max_entries if self.cache else None
+        if len(blocks) < 2 or (max_entries is not None and
+                               len(blocks) > max_entries):
+            # rendering the blocks in order through a smaller LRU cache
+            # would evict each of them before the next render needs it
+            return self.func(text)
+        rendered = self.join([self.render_block(block) for block in blocks])
+        if rendered is None:
+            return self.func(text)
+        return rendered
+
+    def render_block(self, block):
+        if self.cache is None:
+            return self.block_func(block)
+        key = render_key(block, self.filter_path, self.block_kwargs)
+        return self.cache.render(self.block_func, block, key)
+
+
+# shared by the renderers of MarkupField and of the preview
+block_cache = get_render_cache(settings.MARKITUP_BLOCK_CACHE,
+                               settings.MARKITUP_BLOCK_CACHE_MAX_ENTRIES)
+
+
+def get_block_renderer(func, filter_path, filter_kwargs=None):
+    """
+    Return ``func`` wrapped in a ``BlockRenderer`` if the
+    MARKITUP_RENDER_BLOCKS setting is ``True`` and the syntax of the
+    filter is known, and ``func`` otherwise.
+
+    """
+    if (not settings.MARKITUP_RENDER_BLOCKS or
+            get_syntax(filter_path, filter_kwargs) is None):
+        return func
+    return BlockRenderer(func, filter_path, filter_kwargs, block_cache)
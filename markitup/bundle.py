@@ -0,0 +1,207 @@
+"""
+bundled editor assets for django-markitup
+
+If the MARKITUP_BUNDLE setting is ``True``, ``MarkItUpWidget.media``
+and the ``markitup_media``, ``markitup_js`` and ``markitup_css``
+template tags reference one script (the MarkItUp! scripts and the set's
+``set.js``) and one stylesheet (the skin's and the set's ``style.css``)
+instead of four scripts and two stylesheets.
+
+Bundles are built on first use from the static files found by the
+staticfiles finders, and served by the ``markitup_bundle`` view at URLs
+containing a digest of their content, so that browsers can cache them
+for good. They are compressed once, with gzip and, if the brotli_
+package is installed, brotli, and served compressed to browsers that
+accept it.
+
+Sets and skins given as absolute paths or URLs aren't static files, and
+aren't bundled.
+
+.. _brotli: https://pypi.org/project/Brotli/
+
+"""
+from __future__ import unicode_literals
+
+import gzip
+import hashlib
+import io
+import json
+import posixpath
+import re
+
+from django.contrib.staticfiles import finders
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.http import urlencode
+try:
+    from django.urls import NoReverseMatch, reverse
+except ImportError:
+    from django.core.urlresolvers import NoReverseMatch, reverse
+
+from markitup.util import STATIC_SETTINGS, absolute_url
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JS_FILES = ('markitup/ajax_csrf.js', 'markitup/jquery.markitup.js',
+            '{set}/set.js', 'markitup/django-markitup.js')
+CSS_FILES = ('{skin}/style.css', '{set}/style.css')
+
+CONTENT_TYPES = {
+    'js': 'text/javascript; charset=utf-8',
+    'css': 'text/css; charset=utf-8',
+}
+
+# relative url()s in stylesheets, which are rewritten
+_CSS_URL_RE = re.compile(
+    r'''url\(\s*(['"]?)(?![a-z]+:|/|#)([^'")?#]+)([^'")]*)\1\s*\)''', re.I)
+
+# built bundles by (kind, set, skin), and bundle URLs by (set, skin)
+_bundles = {}
+_bundle_urls = {}
+
+
+def _gzip(content):
+    # gzip.compress() only takes mtime on Python 3.8+; a fixed mtime
+    # keeps the compressed bundle the same across processes
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+class Bundle(object):
+    """
+    The content of a bundle, and its compressed variants.
+
+    """
+    def __init__(self, content, content_type):
+        self.content = content.encode('utf-8')
+        self.content_type = content_type
+        self.digest = hashlib.sha256(self.content).hexdigest()[:16]
+        self.gzip = _gzip(self.content)
+        self.br = brotli.compress(self.content) if brotli else None
+
+    def encoded(self, accept_encoding):
+        """
+        Return the smallest variant accepted by a browser sending the
+        ``accept_encoding`` header, and its content encoding.
+
+        """
+        if self.br is not None and re.search(r'\bbr\b', accept_encoding):
+            return self.br, 'br'
+        if re.search(r'\bgzip\b', accept_encoding):
+            return self.gzip, 'gzip'
+        return self.content, None
+
+
+def static_path(path):
+    """
+    Return ``path`` without a trailing slash if it is relative to
+    STATIC_URL, otherwise ``None``.
+
+    """
+    if (not path or path.startswith(('http://', 'https://', '/')) or
+            '..' in path.split('/')):
+        return None
+    return path.rstrip('/')
+
+
+def _read(path):
+    # the source files, as collectstatic would find them
+    found = finders.find(path)
+    if not found:
+        raise IOError("Static file %r not found" % path)
+    with open(found, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def _rewrite_urls(css, path):
+    directory = posixpath.dirname(path)
+
+    def rewrite(match):
+        url = posixpath.normpath(posixpath.join(directory, match.group(2)))
+        return 'url("%s%s")' % (absolute_url(url), match.group(3))
+    return _CSS_URL_RE.sub(rewrite, css)
+
+
+def _build(kind, set_path, skin_path):
+    paths = [p.format(set=set_path, skin=skin_path)
+             for p in (JS_FILES if kind == 'js' else CSS_FILES)]
+    if kind == 'js':
+        # jquery.markitup.js finds its templates next to itself
+        root = posixpath.dirname(absolute_url('markitup/jquery.markitup.js'))
+        parts = [_read(path) for path in paths]
+        parts.insert(3, 'if (!mySettings.root) { mySettings.root = %s; }'
+                     % json.dumps(root + '/'))
+        content = '\n;\n'.join(parts)
+    else:
+        content = '\n'.join(_rewrite_urls(_read(path), path)
+                            for path in paths)
+    return Bundle(content, CONTENT_TYPES[kind])
+
+
+def get_bundle(kind, set_path, skin_path=None):
+    """
+    Return the ``'js'`` or ``'css'`` ``Bundle`` of the set and skin at
+    the static paths ``set_path`` and ``skin_path``, or ``None`` if
+    their files aren't found.
+
+    """
+    set_path, skin_path = static_path(set_path), static_path(skin_path)
+    if kind not in CONTENT_TYPES or set_path is None or (
+            kind == 'css' and skin_path is None):
+        return None
+    if kind == 'js':
+        skin_path = None
+    key = (kind, set_path, skin_path)
+    try:
+        return _bundles[key]
+    except KeyError:
+        pass
+    try:
+        bundle = _build(kind, set_path, skin_path)
+    except (IOError, OSError, ValueError):
+        return None
+    return _bundles.setdefault(key, bundle)
+
+
+def _get_bundle_urls(set_path, skin_path):
+    js = get_bundle('js', set_path)
+    css = get_bundle('css', set_path, skin_path)
+    if js is None or css is None:
+        return None
+    try:
+        return tuple(
+            '%s?%s' % (reverse('markitup_bundle', kwargs={
+                'digest': bundle.digest, 'kind': kind}), urlencode(query))
+            for kind, bundle, query in (
+                ('js', js, [('set', static_path(set_path))]),
+                ('css', css, [('set', static_path(set_path)),
+                              ('skin', static_path(skin_path))])))
+    except NoReverseMatch:
+        return None
+
+
+def bundle_urls(set_path, skin_path):
+    """
+    Return the URLs of the script and stylesheet bundles of a set and
+    skin, or ``None`` if they can't be bundled.
+
+    """
+    key = (set_path, skin_path)
+    try:
+        return _bundle_urls[key]
+    except KeyError:
+        return _bundle_urls.setdefault(
+            key, _get_bundle_urls(set_path, skin_path))
+
+
+@receiver(setting_changed)
+def _reset_bundles(setting, **kwargs):
+    if setting in STATIC_SETTINGS + ('ROOT_URLCONF',):
+        _bundles.clear()
+        _bundle_urls.clear()
@@ -0,0 +1,197 @@
+"""
+render caches for django-markitup
+
+Rendering markup is expensive, and the same text is often rendered
+over and over again (e.g. by the auto-refreshing AJAX preview).  This
+module provides a small ``RenderCache`` that memoizes rendered HTML
+under a digest of the markup and the filter configuration used to
+render it.
+
+The storage behind a ``RenderCache`` is selected with a single value:
+
+* ``None`` disables caching.
+
+* ``'local'`` uses a bounded in-process LRU (``LocalCache``), with
+  entries expiring after ``MARKITUP_CACHE_TIMEOUT`` seconds and at most
+  ``MARKITUP_CACHE_MAX_ENTRIES`` entries kept (or as many as the caller
+  asks for).
+
+* Any other string is the alias of a cache in Django's ``CACHES``
+  setting.
+
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from markitup import settings
+
+LOCAL = 'local'
+
+
+def render_key(text, filter_path, filter_kwargs=None):
+    """
+    Return a cache key for ``text`` rendered by the filter function at
+    ``filter_path`` with ``filter_kwargs``.
+
+    """
+    digest = hashlib.sha256()
+    config = (filter_path, sorted((filter_kwargs or {}).items()))
+    digest.update(repr(config).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return 'markitup:%s' % digest.hexdigest()
+
+
+class LocalCache(object):
+    """
+    A thread-safe in-process LRU cache holding at most ``max_entries``
+    entries, each of which expires ``timeout`` seconds after it was set
+    (``None`` means entries never expire).
+
+    """
+    def __init__(self, max_entries, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        expires = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCache(object):
+    """
+    Stores entries in the Django cache ``alias``, which is looked up on
+    each use since Django's cache connections are per-thread.
+
+    """
+    def __init__(self, alias):
+        self.alias = alias
+
+    def get(self, key, default=None):
+        return caches[self.alias].get(key, default)
+
+    def set(self, key, value, timeout=None):
+        caches[self.alias].set(key, value, timeout)
+
+
+class RenderCache(object):
+    """
+    Memoizes rendered markup in ``backend`` (any object with Django's
+    cache ``get``/``set`` interface) and counts hits and misses.
+
+    Renderings longer than ``max_entry_size`` characters are not stored,
+    so that a few huge documents can't evict everything else.
+
+    """
+    def __init__(self, backend, timeout=None, max_entry_size=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_entry_size = max_entry_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        """
+        The number of entries the backend keeps, or ``None`` if it isn't
+        bounded by a number of entries.
+
+        """
+        return getattr(self.backend, 'max_entries', None)
+
+    def render(self, func, text, key):
+        """
+        Return the cached rendering stored under ``key``, calling
+        ``func(text)`` and storing its result on a miss.
+
+        """
+        return self.render_status(func, text, key)[0]
+
+    def render_status(self, func, text, key):
+        """
+        Like ``render``, but return a ``(rendered, hit)`` two-tuple.
+
+        """
+        rendered = self.backend.get(key)
+        with self._lock:
+            if rendered is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if rendered is not None:
+            return rendered, True
+        rendered = func(text)
+        if self.max_entry_size is None or len(rendered) <= self.max_entry_size:
+            self.backend.set(key, rendered, self.timeout)
+        return rendered, False
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+def get_cache(name, max_entries=None):
+    """
+    Return the cache named by ``name`` (see the module docstring), or
+    ``None`` if ``name`` is ``None``. A ``'local'`` cache keeps at most
+    ``max_entries`` entries, MARKITUP_CACHE_MAX_ENTRIES by default.
+
+    """
+    if name is None:
+        return None
+    if name == LOCAL:
+        if max_entries is None:
+            max_entries = settings.MARKITUP_CACHE_MAX_ENTRIES
+        return LocalCache(max_entries, settings.MARKITUP_CACHE_TIMEOUT)
+    return DjangoCache(name)
+
+
+def get_render_cache(name, max_entries=None):
+    """
+    Return a ``RenderCache`` for the cache named by ``name``, or
+    ``None`` if ``name`` is ``None``.
+
+    """
+    if name is None:
+        return None
+    return RenderCache(get_cache(name, max_entries),
+                       settings.MARKITUP_CACHE_TIMEOUT,
+                       settings.MARKITUP_CACHE_MAX_ENTRY_SIZE)
@@ -1,28 +1,125 @@
 from functools import partial
 
 from django.conf import settings
-from django.db import models
+from django.core.signals import setting_changed
+from django.db import models, transaction
+from django.dispatch import receiver
 from django.utils.safestring import mark_safe, SafeData
 from django.core.exceptions import ImproperlyConfigured
 from markitup import widgets
+from markitup.cache import get_render_cache, render_key
+from markitup.filters import (LazyFilter, build_filter, import_filter,
+                              resolve_filter)
+from markitup.signals import timed_render
+from markitup.tasks import PENDING, background_queue
 
 _rendered_field_name = lambda name: '_%s_rendered' % name
+_rendered_source_name = lambda name: '_%s_rendered_source' % name
+_markup_cache_name = lambda name: '_%s_markup' % name
+# names of the fields of an instance to render in the background once saved
+_PENDING_RENDERS = '_markitup_pending_renders'
+# set on an instance from the pre_save to the post_save signal of
+# Model.save(); pre_save also runs without them, e.g. in bulk_create()
+_SAVING = '_markitup_saving'
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return dict, tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return set, frozenset(_freeze(v) for v in value)
+    return value
+
+# render functions resolved by _get_render_func, by path and arguments
+_render_funcs = {}
 
 def _get_render_func(dotted_path, **kwargs):
-    module, func = dotted_path.rsplit('.', 1)
-    func = getattr(__import__(module, {}, {}, [func]), func)
-    return partial(func, **kwargs)
-
-try:
-    render_func = _get_render_func(settings.MARKITUP_FILTER[0],
-                                   **settings.MARKITUP_FILTER[1])
-except ImportError as e:
-    raise ImproperlyConfigured("Could not import MARKITUP_FILTER %s: %s" %
-                               (settings.MARKITUP_FILTER, e))
-except AttributeError as e:
-    raise ImproperlyConfigured("MARKITUP_FILTER setting is required")
+    try:
+        key = (dotted_path, _freeze(kwargs))
+        func = _render_funcs.get(key)
+    except TypeError:
+        # unhashable or unorderable arguments can't be memoized
+        return partial(import_filter(dotted_path), **kwargs)
+    if func is None:
+        func = _render_funcs.setdefault(
+            key, partial(import_filter(dotted_path), **kwargs))
+    return func
+
+def _build_render_func():
+    try:
+        return build_filter(*settings.MARKITUP_FILTER)
+    except ImportError as e:
+        raise ImproperlyConfigured("Could not import MARKITUP_FILTER %s: %s" %
+                                   (settings.MARKITUP_FILTER, e))
+    except AttributeError as e:
+        raise ImproperlyConfigured("MARKITUP_FILTER setting is required")
+
+# the function rendering MarkupFields, resolved from the MARKITUP_FILTER
+# setting on first use, rather than on import, so that processes that
+# never render don't import the filter's markup library
+render_func = _lazy_render_func = LazyFilter(_build_render_func)
+
+def get_render_func():
+    """
+    Return the function rendering MarkupFields: ``render_func``,
+    resolved if it is still the lazy default.
+
+    """
+    if isinstance(render_func, LazyFilter):
+        return render_func.get()
+    return render_func
+
+def default_filter():
+    """
+    Return the ``(func, config)`` two-tuple of the default filter of
+    MarkupFields: ``render_func`` and the MARKITUP_FILTER setting.
+
+    """
+    try:
+        config = settings.MARKITUP_FILTER
+    except AttributeError:
+        raise ImproperlyConfigured("MARKITUP_FILTER setting is required")
+    return render_func, config
+
+@receiver(setting_changed)
+def _reset_render_func(setting, **kwargs):
+    if setting == 'MARKITUP_FILTER':
+        _lazy_render_func.reset()
+
+def get_markup_fields(model):
+    """
+    Return the concrete ``MarkupField`` instances of ``model``,
+    including those inherited from abstract parents.
+
+    """
+    return [f for f in model._meta.concrete_fields
+            if isinstance(f, MarkupField)]
+
+
+def _render_source(raw, config):
+    filter_path, filter_kwargs = config
+    return (raw, filter_path, _freeze(filter_kwargs))
+
+
+class _InitialSource(object):
+    """
+    Stands for the render source of a raw value set by
+    ``Model.__init__``, which, if the instance was loaded from the
+    database, is the source of the rendered column loaded with it. Only
+    the filter configuration is kept, rather than a copy of the raw
+    value.
+
+    """
+    __slots__ = ('config',)
+
+    def __init__(self, config):
+        self.config = config
+
 
 class Markup(SafeData):
+    __slots__ = ('instance', 'field_name', 'rendered_field_name')
+
     def __init__(self, instance, field_name, rendered_field_name):
         # instead of storing actual values store a reference to the instance
         # along with field names, this makes assignment possible
@@ -32,14 +129,34 @@ class Markup(SafeData):
 
     # raw is read/write
     def _get_raw(self):
-        return self.instance.__dict__[self.field_name]
+        try:
+            return self.instance.__dict__[self.field_name]
+        except KeyError:
+            # the raw field was deferred, load it like Django would
+            self.instance.refresh_from_db(fields=[self.field_name])
+            return self.instance.__dict__[self.field_name]
     def _set_raw(self, val):
         setattr(self.instance, self.field_name, val)
     raw = property(_get_raw, _set_raw)
 
     # rendered is a read only property
     def _get_rendered(self):
-        return getattr(self.instance, self.rendered_field_name)
+        field = self.instance._meta.get_field(self.field_name)
+        try:
+            rendered = getattr(self.instance, self.rendered_field_name)
+        except AttributeError:
+            if not field.render_on_read:
+                raise
+        else:
+            if rendered != PENDING:
+                return rendered
+            # the background render isn't done yet
+            field.update_rendered(self.instance)
+            return getattr(self.instance, self.rendered_field_name)
+        # render on first access and keep the result on the instance
+        rendered = field.render(self.raw, self.instance)
+        setattr(self.instance, self.rendered_field_name, rendered)
+        return rendered
     rendered = property(_get_rendered)
 
     # allows display via templates to work without safe filter
@@ -52,33 +169,114 @@ class Markup(SafeData):
 
     def render_with(self, dotted_path, **kwargs):
         render_func = _get_render_func(dotted_path, **kwargs)
-        rendered = render_func(self.raw)
+        self._set_rendered(timed_render(
+            'render_with', dotted_path, render_func, self.raw,
+            instance=self.instance, field_name=self.field_name))
+
+    def _set_rendered(self, rendered):
         setattr(self.instance, self.rendered_field_name, rendered)
+        # the rendered value no longer matches MARKITUP_FILTER
+        self.instance.__dict__.pop(_rendered_source_name(self.field_name), None)
+
+
+def render_with(markups, dotted_path, executor=None, **kwargs):
+    """
+    Render each of the ``Markup`` objects ``markups`` like
+    ``Markup.render_with``, resolving the filter function only once. If
+    ``executor`` (a ``concurrent.futures`` executor) is given, renders
+    run in it.
+
+    """
+    markups = list(markups)
+    render = partial(timed_render, 'render_with', dotted_path,
+                     _get_render_func(dotted_path, **kwargs))
+    raws = [markup.raw for markup in markups]
+    if executor is None:
+        rendered = map(render, raws)
+    else:
+        rendered = executor.map(render, raws)
+    for markup, html in zip(markups, rendered):
+        markup._set_rendered(html)
 
 
 class MarkupDescriptor(object):
     def __init__(self, field):
         self.field = field
         self.rendered_field_name = _rendered_field_name(self.field.name)
+        self.rendered_source_name = _rendered_source_name(self.field.name)
+        self.markup_cache_name = _markup_cache_name(self.field.name)
 
     def __get__(self, instance, owner):
         if instance is None:
             raise AttributeError('Can only be accessed via an instance.')
-        markup = instance.__dict__[self.field.name]
-        if markup is None:
+        # a deferred raw field is only loaded when the raw value is used
+        if instance.__dict__.get(self.field.name, '') is None:
             return None
-        return Markup(instance, self.field.name, self.rendered_field_name)
+        # reuse the Markup of this instance, unless the instance was
+        # copied along with the Markup of another instance. The Markup
+        # and the instance refer to each other, so the instance is only
+        # freed by the garbage collector once its Markup was used; the
+        # Markup can't refer to it weakly, as it must keep the instance
+        # alive in e.g. Post(body=text).body.rendered
+        markup = instance.__dict__.get(self.markup_cache_name)
+        if markup is None or markup.instance is not instance:
+            markup = Markup(instance, self.field.name, self.rendered_field_name)
+            instance.__dict__[self.markup_cache_name] = markup
+        return markup
 
     def __set__(self, obj, value):
+        obj.__dict__.pop(self.markup_cache_name, None)
+        if self.field.render_on_read:
+            obj.__dict__.pop(self.rendered_field_name, None)
         if isinstance(value, Markup):
             obj.__dict__[self.field.name] = value.raw
-            setattr(obj, self.rendered_field_name, value.rendered)
+            if self.rendered_field_name in value.instance.__dict__:
+                setattr(obj, self.rendered_field_name, value.rendered)
+                source = value.instance.__dict__.get(self.rendered_source_name)
+            else:
+                source = None
+                self._load_rendered(obj)
+            if source is not None:
+                obj.__dict__[self.rendered_source_name] = source
+            else:
+                obj.__dict__.pop(self.rendered_source_name, None)
+        elif obj._state.adding and self.field.add_rendered_field:
+            # set by Model.__init__ (or before the first save): the
+            # rendered column loaded along with it, if any, matches it
+            obj.__dict__[self.field.name] = value
+            obj.__dict__[self.rendered_source_name] = _InitialSource(
+                self.field.get_filter_config())
         else:
+            source = obj.__dict__.get(self.rendered_source_name)
+            if isinstance(source, _InitialSource):
+                # the raw value the rendered column was loaded with
+                obj.__dict__[self.rendered_source_name] = _render_source(
+                    obj.__dict__[self.field.name], source.config)
             obj.__dict__[self.field.name] = value
+            self._load_rendered(obj)
+
+    def _load_rendered(self, obj):
+        # Model.save() leaves deferred fields out of the update, so a
+        # deferred rendered field would never be saved. Load a
+        # placeholder instead, which pre_save replaces.
+        if (self.field.add_rendered_field and not obj._state.adding and
+                self.rendered_field_name not in obj.__dict__):
+            obj.__dict__[self.rendered_field_name] = ''
+            obj.__dict__.pop(self.rendered_source_name, None)
 
 class MarkupField(models.TextField):
     def __init__(self, *args, **kwargs):
         self.add_rendered_field = not kwargs.pop('no_rendered_field', False)
+        self.always_render = kwargs.pop('always_render', False)
+        self.render_on_read = (kwargs.pop('render_on_read', False) and
+                               not self.add_rendered_field)
+        self.defer_rendered = kwargs.pop('defer_rendered', False)
+        self.render_cache_name = kwargs.pop('render_cache', None)
+        self.filter_name = kwargs.pop('filter', None)
+        self.render_cache = get_render_cache(self.render_cache_name)
+        self.render_in_background = (
+            kwargs.pop('render_in_background', False) and
+            self.add_rendered_field)
         super(MarkupField, self).__init__(*args, **kwargs)
 
     def contribute_to_class(self, cls, name):
@@ -87,13 +285,115 @@ class MarkupField(models.TextField):
             cls.add_to_class(_rendered_field_name(name), rendered_field)
         super(MarkupField, self).contribute_to_class(cls, name)
         setattr(cls, self.name, MarkupDescriptor(self))
+        if self.render_in_background and not cls._meta.abstract:
+            models.signals.pre_save.connect(_start_save, sender=cls)
+            models.signals.post_save.connect(_enqueue_pending_renders,
+                                             sender=cls)
 
     def pre_save(self, model_instance, add):
         value = super(MarkupField, self).pre_save(model_instance, add)
-        rendered = render_func(value.raw)
-        setattr(model_instance, _rendered_field_name(self.attname), rendered)
+        if (self.render_in_background and
+                model_instance.__dict__.get(_SAVING)):
+            self.enqueue_render(model_instance, force=self.always_render)
+        elif not self.render_on_read:
+            self.update_rendered(model_instance, force=self.always_render,
+                                 sender='pre_save')
         return value.raw
 
+    def is_rendered(self, model_instance):
+        """
+        Return whether the rendered field of ``model_instance`` is known
+        to be up to date, i.e. neither the raw markup nor
+        MARKITUP_FILTER changed since it was rendered or loaded, and it
+        isn't waiting for a background render.
+
+        """
+        rendered_name = _rendered_field_name(self.attname)
+        if model_instance.__dict__.get(rendered_name) == PENDING:
+            return False
+        source = model_instance.__dict__.get(
+            _rendered_source_name(self.attname))
+        if isinstance(source, _InitialSource):
+            # loaded from the database, rather than created
+            return (not model_instance._state.adding and
+                    source.config == self.get_filter_config())
+        return source is not None and source == self.render_source(
+            model_instance.__dict__[self.attname])
+
+    def update_rendered(self, model_instance, force=False, sender='field'):
+        """
+        Render the raw markup of ``model_instance`` into its rendered
+        field, unless it is known to be up to date and ``force`` is
+        false.
+
+        """
+        if force or not self.is_rendered(model_instance):
+            raw = model_instance.__dict__[self.attname]
+            rendered = self.render(raw, model_instance, sender)
+            setattr(model_instance, _rendered_field_name(self.attname),
+                    rendered)
+            model_instance.__dict__[_rendered_source_name(self.attname)] = (
+                self.render_source(raw))
+
+    def enqueue_render(self, model_instance, force=False):
+        """
+        Mark the rendered field of ``model_instance`` as pending and
+        have the background queue render it once the instance is saved
+        and the current transaction commits, unless it is known to be
+        up to date and ``force`` is false.
+
+        """
+        if not force and self.is_rendered(model_instance):
+            return
+        setattr(model_instance, _rendered_field_name(self.attname), PENDING)
+        model_instance.__dict__.pop(_rendered_source_name(self.attname), None)
+        model_instance.__dict__.setdefault(_PENDING_RENDERS, set()).add(
+            self.name)
+
+    def _enqueue_on_commit(self, model_instance, using):
+        def enqueue():
+            background_queue.enqueue(model_instance._meta.label,
+                                     model_instance.pk, self.name, using)
+        transaction.on_commit(enqueue, using=using)
+
+    def get_render_func(self):
+        """
+        Return the function rendering this field: that of its named
+        filter, if any, or ``render_func``.
+
+        """
+        return resolve_filter(self.filter_name, default_filter)[0]
+
+    def get_filter_config(self):
+        """
+        Return the ``(dotted path, kwargs)`` of the filter rendering
+        this field.
+
+        """
+        return resolve_filter(self.filter_name, default_filter)[1]
+
+    def render_source(self, raw):
+        """
+        Return what a rendering of the raw markup ``raw`` depends on:
+        ``raw`` and the filter configuration. Unlike the render function
+        it is picklable, so it survives caching model instances.
+
+        """
+        return _render_source(raw, self.get_filter_config())
+
+    def render(self, raw, instance=None, sender='field'):
+        """
+        Return the rendered HTML for the raw markup ``raw`` of
+        ``instance``, sending ``markup_rendered`` from ``sender``.
+
+        """
+        func, config = resolve_filter(self.filter_name, default_filter)
+        key = None
+        if self.render_cache is not None:
+            key = render_key(raw, *config)
+        return timed_render(sender, self.filter_name or config[0], func, raw,
+                            self.render_cache, key, instance, self.name)
+
     def value_to_string(self, obj):
         value = self.value_from_object(obj)
         return value.raw
@@ -110,6 +410,18 @@ class MarkupField(models.TextField):
         # deconstruct can be called multiple times during the migration,
         # so setting it to self.add_rendered_field may do the wrong thing.
         kwargs['no_rendered_field'] = True
+        if self.always_render:
+            kwargs['always_render'] = True
+        if self.render_on_read:
+            kwargs['render_on_read'] = True
+        if self.defer_rendered:
+            kwargs['defer_rendered'] = True
+        if self.render_cache_name is not None:
+            kwargs['render_cache'] = self.render_cache_name
+        if self.render_in_background:
+            kwargs['render_in_background'] = True
+        if self.filter_name is not None:
+            kwargs['filter'] = self.filter_name
         return name, path, args, kwargs
 
     # this method should be renamed to get_prep_value but
@@ -123,10 +435,26 @@ class MarkupField(models.TextField):
     def formfield(self, **kwargs):
         defaults = {'widget': widgets.MarkupTextarea}
         defaults.update(kwargs)
+        widget = defaults['widget']
+        if (self.filter_name is not None and isinstance(widget, type) and
+                issubclass(widget, widgets.MarkItUpWidget)):
+            # preview with the filter of this field
+            defaults['widget'] = widget(preview_filter=self.filter_name)
         field = super(MarkupField, self).formfield(**defaults)
         field.hidden_widget = widgets.MarkupHiddenWidget
         return field
 
+def _start_save(sender, instance, **kwargs):
+    instance.__dict__[_SAVING] = True
+
+def _enqueue_pending_renders(sender, instance, using, **kwargs):
+    # enqueue once the row is written: outside of atomic(), on_commit
+    # runs callbacks right away, which would be before the row exists
+    # (or holds PENDING) if done in pre_save
+    instance.__dict__.pop(_SAVING, None)
+    for name in instance.__dict__.pop(_PENDING_RENDERS, ()):
+        instance._meta.get_field(name)._enqueue_on_commit(instance, using)
+
 # register MarkupField to use the custom widget in the Admin
 from django.contrib.admin.options import FORMFIELD_FOR_DBFIELD_DEFAULTS
 FORMFIELD_FOR_DBFIELD_DEFAULTS[MarkupField] = {'widget': widgets.AdminMarkItUpWidget}
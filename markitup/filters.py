@@ -0,0 +1,142 @@
+"""
+named markup filters for django-markitup
+
+The MARKITUP_FILTERS setting maps names to markup filters, each given
+in the same format as the MARKITUP_FILTER setting::
+
+    MARKITUP_FILTERS = {
+        'comments': ('markdown.markdown', {}),
+        'docs': ('markitup.renderers.render_rest', {}),
+    }
+
+``MarkupField(filter='docs')``, the ``render_markup`` template filter
+(``{{ text|render_markup:"docs" }}``) and the preview views (with a
+``filter`` parameter) render with the named filter instead of the
+default one. Filter functions are resolved on first use and kept until
+the MARKITUP_FILTERS setting changes.
+
+"""
+from __future__ import unicode_literals
+
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from markitup.blocks import get_block_renderer
+
+_filters = {}
+_lock = threading.Lock()
+
+
+def import_filter(dotted_path):
+    """
+    Import and return the filter function at ``dotted_path``.
+
+    """
+    module, name = dotted_path.rsplit('.', 1)
+    return getattr(__import__(module, {}, {}, [name]), name)
+
+
+def build_filter(filter_path, filter_kwargs):
+    """
+    Return the function rendering markup with the filter function at
+    ``filter_path`` and ``filter_kwargs``, through the render backend
+    and, if enabled, block by block.
+
+    """
+    # markitup.backends imports this module
+    from markitup.backends import render_backend
+
+    func = partial(import_filter(filter_path), **filter_kwargs)
+    func = render_backend.wrap(func, filter_path, filter_kwargs)
+    return get_block_renderer(func, filter_path, filter_kwargs)
+
+
+class LazyFilter(object):
+    """
+    A rendering function resolved by calling ``resolve()`` on first use,
+    and again after ``reset()``.
+
+    """
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._func = None
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+    def get(self):
+        """
+        Return the resolved rendering function.
+
+        """
+        func = self._func
+        if func is None:
+            func = self._func = self._resolve()
+        return func
+
+    def reset(self):
+        self._func = None
+
+
+def get_filter_config(name):
+    """
+    Return the ``(filter_path, filter_kwargs)`` two-tuple of the filter
+    named ``name``.
+
+    """
+    try:
+        return getattr(settings, 'MARKITUP_FILTERS', {})[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            "Unknown markup filter %r, add it to MARKITUP_FILTERS." % name)
+
+
+def _build_named_filter(name):
+    filter_path, filter_kwargs = get_filter_config(name)
+    try:
+        return build_filter(filter_path, filter_kwargs)
+    except (ImportError, AttributeError) as e:
+        raise ImproperlyConfigured("Could not import markup filter %r %s: %s"
+                                   % (name, filter_path, e))
+
+
+def get_filter(name):
+    """
+    Return the rendering function of the filter named ``name``. Its
+    filter function is imported on first call.
+
+    """
+    try:
+        return _filters[name]
+    except KeyError:
+        pass
+    # fail right away on unknown names
+    get_filter_config(name)
+    with _lock:
+        return _filters.setdefault(
+            name, LazyFilter(partial(_build_named_filter, name)))
+
+
+def resolve_filter(name, default):
+    """
+    Return the ``(func, config)`` two-tuple of the filter named
+    ``name``: its rendering function and its ``(filter_path,
+    filter_kwargs)`` two-tuple. If ``name`` is ``None``, return
+    ``default()``, the two-tuple of the default filter, instead.
+
+    """
+    if name is None:
+        return default()
+    return get_filter(name), get_filter_config(name)
+
+
+@receiver(setting_changed)
+def _reset_filters(setting, **kwargs):
+    if setting == 'MARKITUP_FILTERS':
+        with _lock:
+            _filters.clear()
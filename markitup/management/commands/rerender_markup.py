@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+import multiprocessing
+import time
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from markitup.fields import _rendered_field_name, get_markup_fields
+
+
+def _init_worker():
+    django.setup()
+
+
+def _render(task):
+    model_label, field_name, raw = task
+    if raw is None:
+        return ''
+    field = apps.get_model(model_label)._meta.get_field(field_name)
+    return field.render(raw)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = ("Re-render the rendered fields of MarkupField values, e.g. "
+            "after changing the MARKITUP_FILTER setting.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'labels', nargs='*', metavar='app_label[.ModelName]',
+            help="Models to re-render; by default every model with a "
+                 "MarkupField.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of rows loaded, rendered and updated at a time.")
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="Number of worker processes used to render; 1 renders "
+                 "in this process.")
+        parser.add_argument(
+            '--start-pk',
+            help="Resume after this primary key (requires a single model).")
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="Database to re-render.")
+
+    def handle(self, *args, **options):
+        models = self.get_models(options['labels'])
+        if options['start_pk'] is not None and len(models) != 1:
+            raise CommandError("--start-pk requires exactly one model.")
+
+        pool = None
+        if options['processes'] > 1:
+            # don't share database connections with the workers
+            connections.close_all()
+            pool = multiprocessing.Pool(options['processes'],
+                                        initializer=_init_worker)
+        try:
+            for model in models:
+                self.rerender(model, pool, options)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def get_models(self, labels):
+        if not labels:
+            return [model for model in apps.get_models()
+                    if self.get_fields(model)]
+        models = []
+        for label in labels:
+            try:
+                if '.' in label:
+                    models.append(apps.get_model(label))
+                else:
+                    models.extend(apps.get_app_config(label).get_models())
+            except LookupError as e:
+                raise CommandError(str(e))
+        return [model for model in models if self.get_fields(model)]
+
+    def get_fields(self, model):
+        if model._meta.proxy or model._meta.swapped:
+            return []
+        return [f for f in get_markup_fields(model) if f.add_rendered_field]
+
+    def rerender(self, model, pool, options):
+        fields = self.get_fields(model)
+        rendered_names = [_rendered_field_name(f.attname) for f in fields]
+        # every row, including those a default manager would hide
+        manager = model._base_manager.db_manager(options['database'])
+        queryset = manager.only(
+            'pk', *[f.attname for f in fields]).order_by('pk')
+        if options['start_pk'] is not None:
+            queryset = queryset.filter(pk__gt=options['start_pk'])
+
+        chunk_size = options['chunk_size']
+        rows = 0
+        started = time.time()
+        for chunk in _chunks(queryset.iterator(chunk_size=chunk_size),
+                             chunk_size):
+            tasks = [(model._meta.label, f.name, obj.__dict__[f.attname])
+                     for obj in chunk for f in fields]
+            if pool is not None:
+                rendered = pool.map(_render, tasks)
+            else:
+                rendered = [_render(task) for task in tasks]
+            rendered = iter(rendered)
+            for obj in chunk:
+                for name in rendered_names:
+                    setattr(obj, name, next(rendered))
+            manager.bulk_update(chunk, rendered_names)
+
+            rows += len(chunk)
+            if options['verbosity'] > 0:
+                self.stdout.write(
+                    "%s: %d rows (%.1f rows/s), checkpoint pk %s" % (
+                        model._meta.label, rows, self.rate(rows, started),
+                        chunk[-1].pk))
+
+        if options['verbosity'] > 0:
+            self.stdout.write("%s: re-rendered %d rows in %.1fs (%.1f rows/s)" % (
+                model._meta.label, rows, time.time() - started,
+                self.rate(rows, started)))
+
+    def rate(self, rows, started):
+        elapsed = time.time() - started
+        return rows / elapsed if elapsed else 0.0
@@ -0,0 +1,91 @@
+from __future__ import unicode_literals
+
+from django.db import models
+
+from markitup.fields import _rendered_field_name, get_markup_fields
+
+
+def render_markup_fields(objs, fields=None, force=False):
+    """
+    Render the ``MarkupField`` values of every model instance in
+    ``objs`` (all of which must be instances of the same model), and
+    return the names of the rendered fields that were updated.
+
+    ``fields`` limits rendering to the named ``MarkupField`` fields;
+    by default every ``MarkupField`` with a rendered field is rendered.
+    Values that are known to be up to date are only rendered again if
+    ``force`` is true.
+
+    """
+    objs = list(objs)
+    if not objs:
+        return []
+    markup_fields = [f for f in get_markup_fields(type(objs[0]))
+                     if f.add_rendered_field and
+                     (fields is None or f.name in fields)]
+    for obj in objs:
+        for field in markup_fields:
+            field.update_rendered(obj, force=force)
+    return [_rendered_field_name(f.attname) for f in markup_fields]
+
+
+class MarkupQuerySet(models.QuerySet):
+    """
+    A ``QuerySet`` whose ``bulk_create`` and ``bulk_update`` keep the
+    rendered fields of ``MarkupField`` values up to date.
+
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        render_markup_fields(objs)
+        return super(MarkupQuerySet, self).bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        markup_fields = [
+            f.name for f in get_markup_fields(self.model)
+            if f.name in fields or _rendered_field_name(f.attname) in fields]
+        if markup_fields:
+            for rendered_field in render_markup_fields(objs, markup_fields):
+                if rendered_field not in fields:
+                    fields.append(rendered_field)
+        return super(MarkupQuerySet, self).bulk_update(
+            objs, fields, *args, **kwargs)
+
+    def rendered_only(self, *fields):
+        """
+        Load the rendered fields, but not the raw markup, of the named
+        ``MarkupField`` fields (by default all of them); e.g. for pages
+        that only display the rendered markup.
+
+        """
+        markup_fields = [f for f in get_markup_fields(self.model)
+                         if f.add_rendered_field and
+                         (not fields or f.name in fields)]
+        raw = set(f.attname for f in markup_fields)
+        rendered = set(_rendered_field_name(f.attname) for f in markup_fields)
+        clone = self._chain()
+        names, defer = clone.query.deferred_loading
+        if defer:
+            names = (names - rendered) | raw
+        else:
+            names = (names - raw) | rendered
+        clone.query.deferred_loading = (frozenset(names), defer)
+        return clone
+
+
+class MarkupManager(models.Manager.from_queryset(MarkupQuerySet)):
+    """
+    A manager using ``MarkupQuerySet``, which defers the rendered
+    fields of ``MarkupField(defer_rendered=True)`` fields.
+
+    """
+    def get_queryset(self):
+        queryset = super(MarkupManager, self).get_queryset()
+        deferred = [_rendered_field_name(f.attname)
+                    for f in get_markup_fields(self.model)
+                    if f.add_rendered_field and f.defer_rendered]
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        return queryset
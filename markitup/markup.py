@@ -4,7 +4,9 @@ markup filters for django-markitup
 Time-stamp: <2009-03-18 11:44:57 carljm markup.py>
 
 This module provides a ``filter_func`` module-level markup filter
-function based on the MARKITUP_PREVIEW_FILTER setting.
+function based on the MARKITUP_PREVIEW_FILTER setting. It is resolved
+on first use (see ``get_filter_func``), and again after the setting
+changes.
 
 MARKITUP_PREVIEW_FILTER should be a two-tuple, where the first element
 is a dotted-path string to a markup filter function, and the second
@@ -26,18 +28,146 @@ django-template-utils_.
 
 .. _django-template-utils: http://code.google.com/p/django-template-utils/
 
+``render_preview(text)`` renders ``text`` with ``filter_func``, going
+through the render cache selected by the MARKITUP_PREVIEW_CACHE
+setting (if any). ``iter_preview(text)`` yields the same rendering in
+chunks of at most MARKITUP_PREVIEW_CHUNK_SIZE characters. Both take an
+optional ``filter_name`` to render with a filter of the
+MARKITUP_FILTERS setting instead (see ``markitup.filters``).
+
+``render_preview_block(block)`` renders a block of a document split
+the way ``get_preview_syntax()`` says (see ``markitup.blocks``), like
+``render_preview`` but with the extra filter arguments of that syntax.
+
+``filter_func`` renders with the backend selected by the
+MARKITUP_RENDER_BACKEND setting (see ``markitup.backends``) and, if the
+MARKITUP_RENDER_BLOCKS setting is ``True``, block by block (see
+``markitup.blocks``).
+
+A filter function may also return an iterable of strings instead of a
+string; ``iter_preview`` then yields them as they are produced.
+
 """
 from __future__ import unicode_literals
 
-from functools import partial, wraps
+from functools import partial
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from markitup.blocks import get_syntax
+from markitup.cache import get_render_cache, render_key
+from markitup.filters import LazyFilter, build_filter, resolve_filter
+from markitup.signals import timed_render
+from markitup import settings
+
+preview_cache = get_render_cache(settings.MARKITUP_PREVIEW_CACHE)
+
+# functions rendering preview blocks, by filter name (None for
+# MARKITUP_PREVIEW_FILTER), see render_preview_block
+_block_funcs = {}
+
+
+def _build_filter_func():
+    if settings.MARKITUP_PREVIEW_FILTER is None:
+        return lambda text: text
+    return build_filter(*settings.MARKITUP_PREVIEW_FILTER)
+
+filter_func = _lazy_filter_func = LazyFilter(_build_filter_func)
+
+
+def get_filter_func():
+    """
+    Return the function rendering previews: ``filter_func``, resolved
+    if it is still the lazy default.
+
+    """
+    if isinstance(filter_func, LazyFilter):
+        return filter_func.get()
+    return filter_func
+
+
+@receiver(setting_changed)
+def _reset_filter_func(setting, **kwargs):
+    if setting in ('MARKITUP_FILTER', 'MARKITUP_PREVIEW_FILTER'):
+        _lazy_filter_func.reset()
+    if setting in ('MARKITUP_FILTER', 'MARKITUP_PREVIEW_FILTER',
+                   'MARKITUP_FILTERS'):
+        _block_funcs.clear()
+
+
+def _default_filter():
+    return filter_func, settings.MARKITUP_PREVIEW_FILTER
+
+
+def _render_with(func, text):
+    rendered = func(text)
+    if isinstance(rendered, str):
+        return rendered
+    return ''.join(rendered)
+
+
+def _render_text(text, filter_name=None):
+    return _render_with(resolve_filter(filter_name, _default_filter)[0], text)
+
+
+def get_preview_syntax(filter_name=None):
+    """
+    Return the ``markitup.blocks.Syntax`` of the preview filter, or
+    ``None`` if its documents can't be split into blocks.
+
+    """
+    config = resolve_filter(filter_name, _default_filter)[1]
+    if config is None:
+        return None
+    return get_syntax(*config)
+
+
+def render_preview_block(block, filter_name=None):
+    config = resolve_filter(filter_name, _default_filter)[1]
+    syntax = get_preview_syntax(filter_name)
+    if syntax is None or not syntax.extra_kwargs:
+        return render_preview(block, filter_name)
+    filter_path = config[0]
+    filter_kwargs = dict(config[1], **syntax.extra_kwargs)
+    try:
+        func = _block_funcs[filter_name]
+    except KeyError:
+        func = _block_funcs.setdefault(
+            filter_name, build_filter(filter_path, filter_kwargs))
+    cache = key = None
+    if preview_cache is not None:
+        cache = preview_cache
+        key = render_key(block, filter_path, filter_kwargs)
+    return timed_render('preview', filter_name or filter_path,
+                        partial(_render_with, func), block, cache, key)
+
+
+def render_preview(text, filter_name=None):
+    config = resolve_filter(filter_name, _default_filter)[1]
+    if config is None:
+        return _render_text(text, filter_name)
+    cache = key = None
+    if preview_cache is not None:
+        cache, key = preview_cache, render_key(text, *config)
+    return timed_render('preview', filter_name or config[0],
+                        partial(_render_text, filter_name=filter_name),
+                        text, cache, key)
 
-from markitup.settings import MARKITUP_PREVIEW_FILTER
 
-if MARKITUP_PREVIEW_FILTER is None:
-    filter_func = lambda text: text
-else:
-    filter_path, filter_kwargs = MARKITUP_PREVIEW_FILTER
-    # Don't coerce to unicode on python 2
-    module, funcname = filter_path.rsplit(str('.'), 1)
-    func = getattr(__import__(module, {}, {}, [funcname]), funcname)
-    filter_func = wraps(func)(partial(func, **filter_kwargs))
+def iter_preview(text, filter_name=None):
+    func, config = resolve_filter(filter_name, _default_filter)
+    if config is None:
+        rendered = func(text)
+    elif preview_cache is None:
+        rendered = timed_render('preview', filter_name or config[0],
+                                func, text)
+    else:
+        rendered = render_preview(text, filter_name)
+    if isinstance(rendered, str):
+        size = settings.MARKITUP_PREVIEW_CHUNK_SIZE
+        for start in range(0, len(rendered), size):
+            yield rendered[start:start + size]
+    else:
+        for chunk in rendered:
+            yield chunk
@@ -1,19 +1,97 @@
+"""
+markup renderers for django-markitup
+
+``render_rest`` renders reStructuredText with docutils. Building a
+docutils publisher (its settings above all) costs more than rendering a
+short comment, so each thread keeps a publisher per distinct
+combination of docutils settings and reuses it across renders.
+
+"""
 from __future__ import unicode_literals
 
-try:
-    from docutils.core import publish_parts
-
-    def render_rest(markup, **docutils_settings):
-        docutils_settings.update({
-            'raw_enabled': False,
-            'file_insertion_enabled': False,
-        })
-
-        parts = publish_parts(
-            source=markup,
-            writer_name="html4css1",
-            settings_overrides=docutils_settings,
-        )
-        return parts["html_body"]
-except ImportError:
-    pass
+import threading
+
+_local = threading.local()
+
+
+def _body_writer(part):
+    # docutils is only imported by processes that render reST
+    from docutils.writers.html4css1 import Writer
+
+    class BodyWriter(Writer):
+        """
+        An html4css1 writer that only joins the ``part`` of the parts
+        ``publish_parts`` returns, without reading the template or
+        assembling the others.
+
+        """
+        def translate(self):
+            visitor = self.translator_class(self.document)
+            self.document.walkabout(visitor)
+            self.output = ''.join(getattr(visitor, part))
+
+        def assemble_parts(self):
+            pass
+
+    return BodyWriter()
+
+
+def _build_publisher(part, docutils_settings):
+    from docutils import io
+    from docutils.core import Publisher
+
+    publisher = Publisher('standalone', 'restructuredtext',
+                          _body_writer(part), source_class=io.StringInput,
+                          destination_class=io.NullOutput)
+    overrides = dict(docutils_settings, raw_enabled=False,
+                     file_insertion_enabled=False,
+                     # stylesheets aren't part of the body
+                     embed_stylesheet=False)
+    publisher.process_programmatic_settings(None, overrides, None)
+    # a pristine copy for each render, which docutils modifies
+    publisher.defaults = publisher.settings
+    return publisher
+
+
+def _get_publisher(part, docutils_settings):
+    try:
+        key = (part, frozenset(docutils_settings.items()))
+        hash(key)
+    except TypeError:
+        # unhashable setting values; don't reuse the publisher
+        return _build_publisher(part, docutils_settings)
+    try:
+        publishers = _local.publishers
+    except AttributeError:
+        publishers = _local.publishers = {}
+    try:
+        return publishers[key]
+    except KeyError:
+        publisher = publishers[key] = _build_publisher(part,
+                                                       docutils_settings)
+        return publisher
+
+
+def render_rest(markup, fragment=False, **docutils_settings):
+    """
+    Render the reStructuredText ``markup`` to the ``html_body`` part of
+    docutils' html4css1 writer, or its ``fragment`` part (without the
+    document title and the enclosing ``<div class="document">``) if
+    ``fragment`` is ``True``.
+
+    """
+    from docutils.utils import DependencyList
+
+    publisher = _get_publisher('fragment' if fragment else 'html_body',
+                               docutils_settings)
+    publisher.settings = publisher.defaults.copy()
+    publisher.settings.record_dependencies = DependencyList()
+    publisher.set_source(markup)
+    publisher.set_destination()
+    try:
+        publisher.publish()
+        return publisher.writer.output
+    finally:
+        # don't keep the last document alive
+        publisher.document = publisher.reader.document = None
+        publisher.writer.document = publisher.writer.output = None
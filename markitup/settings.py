@@ -1,13 +1,72 @@
 from __future__ import unicode_literals
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 MARKITUP_PREVIEW_FILTER = getattr(settings, 'MARKITUP_PREVIEW_FILTER',
                                   getattr(settings, 'MARKITUP_FILTER', None))
 MARKITUP_AUTO_PREVIEW = getattr(settings, 'MARKITUP_AUTO_PREVIEW', False)
+# Build editors when their textarea gains focus or scrolls into view
+MARKITUP_LAZY = getattr(settings, 'MARKITUP_LAZY', False)
+# Milliseconds to wait for edits to stop / between preview requests
+MARKITUP_PREVIEW_DEBOUNCE = getattr(settings, 'MARKITUP_PREVIEW_DEBOUNCE', 300)
+MARKITUP_PREVIEW_THROTTLE = getattr(settings, 'MARKITUP_PREVIEW_THROTTLE', 0)
 # Defaults include trailing slash so that others know path is a directory
 MARKITUP_SET = getattr(settings, 'MARKITUP_SET', 'markitup/sets/default/')
 MARKITUP_SKIN = getattr(settings, 'MARKITUP_SKIN', 'markitup/skins/simple/')
 JQUERY_URL = getattr(
     settings, 'JQUERY_URL',
     '//ajax.googleapis.com/ajax/libs/jquery/2.0.3/jquery.min.js')
+# Serve the editor's scripts and stylesheets as one hashed bundle each
+MARKITUP_BUNDLE = getattr(settings, 'MARKITUP_BUNDLE', False)
+MARKITUP_PREVIEW_STREAM = getattr(settings, 'MARKITUP_PREVIEW_STREAM', False)
+MARKITUP_PREVIEW_CHUNK_SIZE = getattr(settings, 'MARKITUP_PREVIEW_CHUNK_SIZE', 8192)
+MARKITUP_PREVIEW_MAX_SIZE = getattr(settings, 'MARKITUP_PREVIEW_MAX_SIZE', None)
+# Async preview view: executor ('thread' or 'process'), number of workers,
+# renders in flight and seconds to wait for a render
+MARKITUP_PREVIEW_ASYNC = getattr(settings, 'MARKITUP_PREVIEW_ASYNC', False)
+MARKITUP_PREVIEW_EXECUTOR = getattr(settings, 'MARKITUP_PREVIEW_EXECUTOR', 'thread')
+MARKITUP_PREVIEW_WORKERS = getattr(settings, 'MARKITUP_PREVIEW_WORKERS', 2)
+MARKITUP_PREVIEW_CONCURRENCY = getattr(settings, 'MARKITUP_PREVIEW_CONCURRENCY', 4)
+MARKITUP_PREVIEW_TIMEOUT = getattr(settings, 'MARKITUP_PREVIEW_TIMEOUT', 10)
+# Incremental preview protocol, and the cache holding recent sources
+MARKITUP_PREVIEW_BLOCKS = getattr(settings, 'MARKITUP_PREVIEW_BLOCKS', False)
+MARKITUP_PREVIEW_SOURCE_CACHE = getattr(settings, 'MARKITUP_PREVIEW_SOURCE_CACHE', 'local')
+# Refresh the preview by replacing its body with a rendered fragment
+MARKITUP_PREVIEW_FRAGMENTS = getattr(settings, 'MARKITUP_PREVIEW_FRAGMENTS', False)
+# Render markup block by block, through a cache of rendered blocks
+MARKITUP_RENDER_BLOCKS = getattr(settings, 'MARKITUP_RENDER_BLOCKS', False)
+MARKITUP_BLOCK_CACHE = getattr(settings, 'MARKITUP_BLOCK_CACHE', 'local')
+MARKITUP_BLOCK_CACHE_MAX_ENTRIES = getattr(settings, 'MARKITUP_BLOCK_CACHE_MAX_ENTRIES', 4096)
+# Render backend, and the process pool backend's workers, maximum number
+# of queued renders and seconds to wait for a slot / a render
+MARKITUP_RENDER_BACKEND = getattr(settings, 'MARKITUP_RENDER_BACKEND',
+                                  'markitup.backends.InlineBackend')
+MARKITUP_RENDER_PROCESSES = getattr(settings, 'MARKITUP_RENDER_PROCESSES', 2)
+MARKITUP_RENDER_QUEUE_SIZE = getattr(settings, 'MARKITUP_RENDER_QUEUE_SIZE', 16)
+MARKITUP_RENDER_TIMEOUT = getattr(settings, 'MARKITUP_RENDER_TIMEOUT', 30)
+# Queue of background renders, and the default queue's number of threads
+MARKITUP_BACKGROUND_QUEUE = getattr(settings, 'MARKITUP_BACKGROUND_QUEUE',
+                                    'markitup.tasks.ThreadPoolQueue')
+MARKITUP_BACKGROUND_WORKERS = getattr(settings, 'MARKITUP_BACKGROUND_WORKERS', 2)
+# Log renders slower than this many seconds; aggregate render durations
+MARKITUP_SLOW_RENDER_THRESHOLD = getattr(settings, 'MARKITUP_SLOW_RENDER_THRESHOLD', None)
+MARKITUP_RENDER_STATS = getattr(settings, 'MARKITUP_RENDER_STATS', False)
+MARKITUP_RENDER_STATS_SIZE = getattr(settings, 'MARKITUP_RENDER_STATS_SIZE', 1000)
+# Render cache for the AJAX preview; see markitup.cache for the values
+MARKITUP_PREVIEW_CACHE = getattr(settings, 'MARKITUP_PREVIEW_CACHE', None)
+MARKITUP_CACHE_MAX_ENTRIES = getattr(settings, 'MARKITUP_CACHE_MAX_ENTRIES', 256)
+MARKITUP_CACHE_TIMEOUT = getattr(settings, 'MARKITUP_CACHE_TIMEOUT', 300)
+MARKITUP_CACHE_MAX_ENTRY_SIZE = getattr(settings, 'MARKITUP_CACHE_MAX_ENTRY_SIZE', 65536)
+# Render cache for the render_markup_cached template filter
+MARKITUP_RENDER_CACHE = getattr(settings, 'MARKITUP_RENDER_CACHE', 'default')
+
+
+@receiver(setting_changed)
+def _update_preview_filter(setting, **kwargs):
+    global MARKITUP_PREVIEW_FILTER
+    if setting in ('MARKITUP_FILTER', 'MARKITUP_PREVIEW_FILTER'):
+        MARKITUP_PREVIEW_FILTER = getattr(
+            settings, 'MARKITUP_PREVIEW_FILTER',
+            getattr(settings, 'MARKITUP_FILTER', None))
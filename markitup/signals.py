@@ -0,0 +1,130 @@
+"""
+render signals for django-markitup
+
+``markup_rendered`` is sent after every render done by ``MarkupField``
+(on save, on read or in the background), the ``render_markup`` template
+filters, ``Markup.render_with`` and the preview views. Its sender is
+the kind of render: ``'pre_save'``, ``'field'``, ``'render_markup'``,
+``'render_with'`` or ``'preview'``. Receivers get these keyword
+arguments:
+
+``filter``
+    The name (in MARKITUP_FILTERS) or dotted path of the filter.
+
+``input_size``, ``output_size``
+    The length of the markup and of the rendered HTML.
+
+``duration``
+    The seconds the render took.
+
+``cache_hit``
+    Whether the rendered HTML came from a render cache.
+
+``instance``, ``field_name``
+    The model instance and field rendered, or ``None``.
+
+Renders taking longer than MARKITUP_SLOW_RENDER_THRESHOLD seconds are
+logged as warnings to the ``markitup.renders`` logger.
+
+When a filter returns an iterator of strings (e.g. a streamed
+preview), the render lasts until the iterator is exhausted: its
+duration is the time spent producing the strings, and the signal is
+only sent once the last one has been consumed.
+
+"""
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from django.dispatch import Signal
+
+from markitup import settings
+
+markup_rendered = Signal()
+
+logger = logging.getLogger('markitup.renders')
+
+
+def describe(instance, field_name):
+    """
+    Return a description of the rendered object for log messages.
+
+    """
+    if instance is None:
+        return 'markup'
+    if instance.pk is None:
+        return 'new %s field %s' % (instance._meta.label, field_name)
+    return '%s pk=%s field %s' % (instance._meta.label, instance.pk,
+                                  field_name)
+
+
+def timed_render(sender, filter, func, text, cache=None, key=None,
+                 instance=None, field_name=None):
+    """
+    Return ``func(text)``, or its rendering cached under ``key`` in the
+    render cache ``cache`` if one is given, sending ``markup_rendered``
+    and logging slow renders.
+
+    """
+    threshold = settings.MARKITUP_SLOW_RENDER_THRESHOLD
+    if threshold is None and not markup_rendered.has_listeners(sender):
+        # don't pay for timing
+        if cache is None:
+            return func(text)
+        return cache.render(func, text, key)
+
+    started = time.perf_counter()
+    if cache is None:
+        rendered, cache_hit = func(text), False
+    else:
+        rendered, cache_hit = cache.render_status(func, text, key)
+    duration = time.perf_counter() - started
+
+    if not isinstance(rendered, str) and iter(rendered) is rendered:
+        return _timed_chunks(rendered, duration, sender, filter, text,
+                             instance, field_name)
+    _rendered(sender, filter, text, _size(rendered), duration, cache_hit,
+              instance, field_name)
+    return rendered
+
+
+def _size(value):
+    # markup may also be e.g. a lazy string or a list of strings
+    if isinstance(value, str):
+        return len(value)
+    try:
+        return sum(len(chunk) for chunk in value)
+    except TypeError:
+        return len(str(value))
+
+
+def _timed_chunks(chunks, duration, sender, filter, text, instance,
+                  field_name):
+    output_size = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        finally:
+            duration += time.perf_counter() - started
+        output_size += len(chunk)
+        yield chunk
+    _rendered(sender, filter, text, output_size, duration, False, instance,
+              field_name)
+
+
+def _rendered(sender, filter, text, output_size, duration, cache_hit,
+              instance, field_name):
+    input_size = _size(text)
+    markup_rendered.send(
+        sender=sender, filter=filter, input_size=input_size,
+        output_size=output_size, duration=duration, cache_hit=cache_hit,
+        instance=instance, field_name=field_name)
+    threshold = settings.MARKITUP_SLOW_RENDER_THRESHOLD
+    if threshold is not None and duration >= threshold:
+        logger.warning("Slow %s render of %s with %s: %.3fs for %d characters",
+                       sender, describe(instance, field_name), filter,
+                       duration, input_size)
@@ -4,28 +4,101 @@
   // Config comes from data attributes on config
   function configure_markitup_editor(element, config) {
     var preview_url = config.attr('data-preview-url');
+    var preview_blocks_url = config.attr('data-preview-blocks-url');
+    var preview_fragment_url = config.attr('data-preview-fragment-url');
     var auto_preview = config.attr('data-auto-preview') == '1';
+    var preview_debounce = config.attr('data-preview-debounce');
+    var preview_throttle = config.attr('data-preview-throttle');
     if (!element.hasClass("markItUpEditor")) {
+      var settings = $.extend({}, mySettings);
       if (preview_url) {
-        mySettings["previewParserPath"] = preview_url;
+        settings["previewParserPath"] = preview_url;
       }
-      element.markItUp(mySettings);
+      if (preview_blocks_url) {
+        settings["previewBlocksPath"] = preview_blocks_url;
+      }
+      if (preview_fragment_url) {
+        settings["previewFragmentPath"] = preview_fragment_url;
+      }
+      if (preview_debounce) {
+        settings["previewRefreshDelay"] = parseInt(preview_debounce, 10);
+      }
+      if (preview_throttle) {
+        settings["previewRefreshInterval"] = parseInt(preview_throttle, 10);
+      }
+      element.markItUp(settings);
     }
     if (auto_preview) {
       $('a[title="Preview"]').trigger('mouseup');
     }
   };
 
-  $(function() {
-    $('.django-markitup-widget').each(function(index) {
+  // Builds lazy editors scrolled (almost) into view
+  var observer = null;
+  if ('IntersectionObserver' in window) {
+    observer = new IntersectionObserver(function(entries) {
+      $.each(entries, function(index, entry) {
+        if (entry.isIntersecting) {
+          $(entry.target).trigger('markitup:build');
+        }
+      });
+    }, {rootMargin: '200px'});
+  }
+
+  // Configure the editor on element now, or when it gains focus or
+  // scrolls into view if config has data-lazy="1"
+  function setup_markitup_editor(element, config) {
+    // skip the template row of admin inlines and editors already set up
+    if (!element.length || element.closest('.empty-form').length ||
+        element.attr('data-markitup-setup')) {
+      return;
+    }
+    element.attr('data-markitup-setup', '1');
+    if (config.attr('data-lazy') != '1') {
+      configure_markitup_editor(element, config);
+      return;
+    }
+    element.on('focus.markitup markitup:build.markitup', function(event) {
+      element.off('.markitup');
+      if (observer !== null) {
+        observer.unobserve(this);
+      }
+      configure_markitup_editor(element, config);
+      if (event.type == 'focus') {
+        // building the editor moves the textarea, which loses focus
+        this.focus();
+      }
+    });
+    if (observer !== null) {
+      observer.observe(element.get(0));
+    }
+  };
+
+  // Set up the editors in root (a document or an element)
+  function setup_markitup_editors(root) {
+    $(root).find('.django-markitup-widget').each(function(index) {
       var element = $(this);
-      configure_markitup_editor(element, element);
+      setup_markitup_editor(element, element);
     });
 
-    $('.django-markitup-editor-config').each(function(index) {
+    $(root).find('.django-markitup-editor-config').each(function(index) {
       var config = $(this);
       var element = $(config.attr('data-element'));
-      configure_markitup_editor(element, config);
+      setup_markitup_editor(element, config);
     });
+  };
+
+  $(function() {
+    setup_markitup_editors(document);
   });
+
+  // Rows added to admin inlines; the admin triggers formset:added with
+  // its own jQuery before Django 4.1, and as a DOM event since
+  function formset_added(event, row) {
+    setup_markitup_editors(row || event.target);
+  };
+  $(document).on('formset:added', formset_added);
+  if (window.django && django.jQuery && django.jQuery !== $) {
+    django.jQuery(document).on('formset:added', formset_added);
+  }
 })(jQuery || django.jQuery);
@@ -45,6 +45,10 @@
 					previewParser:			false,
 					previewParserPath:		'',
 					previewParserVar:		'data',
+					previewBlocksPath:		'', // incremental preview, see renderPreviewBlocks
+					previewFragmentPath:	'', // replace the body of the preview page, see renderPreview
+					previewRefreshDelay:	0, // debounce preview refreshes (ms)
+					previewRefreshInterval:	0, // minimum time between preview requests (ms)
 					resizeHandle:			true,
 					beforeInsert:			'',
 					afterInsert:			'',
@@ -97,15 +101,23 @@
 
 		return this.each(function() {
 			var $$, textarea, levels, scrollPosition, caretPosition, caretOffset,
-				clicked, hash, header, footer, previewWindow, template, iFrame, abort;
+				clicked, hash, header, footer, previewWindow, template, iFrame, abort,
+				previewRequest, previewedData, refreshTimer, lastRefresh,
+				previewSource, previewRevision, previewPage;
 			$$ = $(this);
 			textarea = this;
 			levels = [];
 			abort = false;
+			previewRequest = previewedData = refreshTimer = null;
+			previewSource = previewRevision = null;
+			previewPage = false;
+			lastRefresh = 0;
 			scrollPosition = caretPosition = 0;
 			caretOffset = -1;
 
 			options.previewParserPath = localize(options.previewParserPath);
+			options.previewBlocksPath = localize(options.previewBlocksPath);
+			options.previewFragmentPath = localize(options.previewFragmentPath);
 			options.previewTemplatePath = localize(options.previewTemplatePath);
 
 			if (method) {
@@ -514,6 +526,8 @@
 						}	
 						previewWindow = iFrame[iFrame.length - 1].contentWindow || frame[iFrame.length - 1];
 					}
+					previewedData = previewRevision = null;
+					previewPage = false;
 				} else if (altKey === true) {
 					if (iFrame) {
 						iFrame.remove();
@@ -530,9 +544,21 @@
 				}
 			}
 
-			// refresh Preview window
+			// refresh Preview window, once no refresh was asked for during
+			// previewRefreshDelay ms, and at most once every
+			// previewRefreshInterval ms
 			function refreshPreview() {
- 				renderPreview();
+				var wait = Math.max(options.previewRefreshDelay,
+					lastRefresh + options.previewRefreshInterval - new Date().getTime());
+				clearTimeout(refreshTimer);
+				if (wait > 0) {
+					refreshTimer = setTimeout(function() {
+						refreshTimer = null;
+						renderPreview();
+					}, wait);
+				} else {
+					renderPreview();
+				}
 			}
 
 			function renderPreview() {
@@ -542,15 +568,46 @@
 				} else if (options.previewParser && typeof options.previewParser === 'function') {
 					var data = options.previewParser( $$.val() );
 					writeInPreview(localize(data, 1) ); 
-				} else if (options.previewParserPath !== '') {
-					$.ajax({
+				} else if (options.previewBlocksPath !== '' && !options.previewInElement) {
+					renderPreviewBlocks();
+				} else if (options.previewParserPath !== '' || options.previewFragmentPath !== '') {
+					var fragment;
+					phtml = $$.val();
+					// nothing to do if the preview is already up to date
+					if (phtml === previewedData) {
+						return false;
+					}
+					// a newer preview replaces the one in flight
+					if (previewRequest) {
+						previewRequest.abort();
+					}
+					// once the preview page is loaded, only its body is replaced
+					fragment = options.previewFragmentPath !== '' &&
+						(previewPage || options.previewInElement || options.previewParserPath === '');
+					previewedData = phtml;
+					lastRefresh = new Date().getTime();
+					previewRequest = $.ajax({
 						type: 'POST',
 						dataType: 'text',
 						global: false,
-						url: options.previewParserPath,
-						data: options.previewParserVar+'='+encodeURIComponent($$.val()),
+						url: fragment ? options.previewFragmentPath : options.previewParserPath,
+						data: options.previewParserVar+'='+encodeURIComponent(phtml),
 						success: function(data) {
-							writeInPreview( localize(data, 1) ); 
+							if (fragment) {
+								writeFragmentInPreview( localize(data, 1) );
+							} else {
+								writeInPreview( localize(data, 1) );
+							}
+						},
+						error: function(xhr, status) {
+							if (status !== 'abort') {
+								previewedData = null;
+							}
+						},
+						complete: function(xhr) {
+							if (previewRequest === xhr) {
+								previewRequest = null;
+							}
 						}
 					});
 				} else {
@@ -568,6 +625,128 @@
 				return false;
 			}
 			
+			// Incremental preview: send the change since the last rendered
+			// revision, and patch the changed blocks into the preview
+			function renderPreviewBlocks() {
+				var data = $$.val(), request;
+				if (data === previewedData) {
+					return;
+				}
+				if (previewRequest) {
+					previewRequest.abort();
+				}
+				if (previewRevision !== null) {
+					request = {base: previewRevision,
+							   delta: JSON.stringify(textDelta(previewSource, data))};
+				} else {
+					request = {data: data};
+				}
+				previewedData = data;
+				lastRefresh = new Date().getTime();
+				previewRequest = $.ajax({
+					type: 'POST',
+					dataType: 'json',
+					global: false,
+					url: options.previewBlocksPath,
+					data: request,
+					success: function(response) {
+						previewSource = data;
+						previewRevision = response.revision;
+						if (response.page !== undefined) {
+							writeInPreview( localize(response.page, 1) );
+						} else if (!patchPreview(response)) {
+							previewedData = previewRevision = null;
+							renderPreviewBlocks();
+						}
+					},
+					error: function(xhr, status) {
+						if (status === 'abort') {
+							return;
+						}
+						previewedData = null;
+						if (xhr.status === 409) {
+							// the server forgot our revision, start over
+							previewRevision = null;
+							renderPreviewBlocks();
+						}
+					},
+					complete: function(xhr) {
+						if (previewRequest === xhr) {
+							previewRequest = null;
+						}
+					}
+				});
+			}
+
+			// [start, end, text] replacing source[start:end] by text turns
+			// source into data; offsets count code points, like Python
+			function textDelta(source, data) {
+				var start = 0, end = 0, max = Math.min(source.length, data.length);
+				while (start < max && source.charCodeAt(start) === data.charCodeAt(start)) {
+					start++;
+				}
+				while (end < max - start &&
+					   source.charCodeAt(source.length - end - 1) === data.charCodeAt(data.length - end - 1)) {
+					end++;
+				}
+				// don't split surrogate pairs
+				if (start > 0 && isHighSurrogate(source.charCodeAt(start - 1))) {
+					start--;
+				}
+				if (end > 0 && isHighSurrogate(source.charCodeAt(source.length - end - 1))) {
+					end--;
+				}
+				var prefix = codePoints(source.slice(0, start));
+				return [prefix, prefix + codePoints(source.slice(start, source.length - end)),
+						data.slice(start, data.length - end)];
+			}
+
+			function isHighSurrogate(code) {
+				return code >= 0xD800 && code <= 0xDBFF;
+			}
+
+			function codePoints(string) {
+				return string.length - (string.match(/[\uD800-\uDBFF][\uDC00-\uDFFF]/g) || []).length;
+			}
+
+			// reorder the block elements of the preview to match
+			// response.blocks, creating those that are new
+			function patchPreview(response) {
+				var doc, container, pool = {}, created = {}, fragment, i, id, element;
+				if (!previewWindow || !previewWindow.document) {
+					return false;
+				}
+				doc = previewWindow.document;
+				container = $('.markitup-blocks', doc)[0];
+				if (!container) {
+					return false;
+				}
+				$(container).children('.markitup-block').each(function() {
+					id = this.getAttribute('data-block');
+					(pool[id] = pool[id] || []).push(this);
+				});
+				fragment = doc.createDocumentFragment();
+				for (i = 0; i < response.blocks.length; i++) {
+					id = response.blocks[i];
+					if (pool[id] && pool[id].length) {
+						element = pool[id].shift();
+					} else if (created[id]) {
+						element = created[id].cloneNode(true);
+					} else if (response.html.hasOwnProperty(id)) {
+						element = doc.createElement('div');
+						element.className = 'markitup-block';
+						element.setAttribute('data-block', id);
+						element.innerHTML = localize(response.html[id], 1);
+					} else {
+						return false;
+					}
+					created[id] = element;
+					fragment.appendChild(element);
+				}
+				$(container).empty().append(fragment);
+				return true;
+			}
+
 			function writeInPreview(data) {
 				if (options.previewInElement) {
 					$(options.previewInElement).html(data);
@@ -581,6 +760,18 @@
 					previewWindow.document.write(data);
 					previewWindow.document.close();
 					previewWindow.document.documentElement.scrollTop = sp;
+					previewPage = true;
+				}
+			}
+
+			// replace the body of the preview page, keeping its head (and
+			// scroll position); without a page yet, data becomes the page
+			function writeFragmentInPreview(data) {
+				if (!options.previewInElement && previewPage &&
+					previewWindow && previewWindow.document && previewWindow.document.body) {
+					previewWindow.document.body.innerHTML = data;
+				} else {
+					writeInPreview(data);
 				}
 			}
 			
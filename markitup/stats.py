@@ -0,0 +1,102 @@
+"""
+render statistics for django-markitup
+
+``render_stats`` keeps the durations of the last
+MARKITUP_RENDER_STATS_SIZE renders of each kind (see
+``markitup.signals``) and filter, and computes percentiles to feed to
+a metrics system::
+
+    >>> from markitup.stats import render_stats
+    >>> render_stats.connect()
+    >>> render_stats.summary()
+    {('pre_save', 'markdown.markdown'): {'count': 12, 'cache_hits': 0,
+     'p50': 0.0021, 'p90': 0.0094, 'p99': 0.0189}}
+
+It is connected to ``markup_rendered`` on startup if the
+MARKITUP_RENDER_STATS setting is ``True`` (see ``markitup.apps``).
+
+"""
+from __future__ import unicode_literals
+
+import threading
+from collections import deque
+
+from markitup import settings
+from markitup.signals import markup_rendered
+
+
+def percentile(values, p):
+    """
+    Return the ``p``-th percentile of the sorted list ``values``, by
+    linear interpolation.
+
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class RenderStats(object):
+    """
+    Aggregates ``markup_rendered`` signals by sender and filter.
+
+    """
+    def __init__(self, size=None):
+        self.size = size or settings.MARKITUP_RENDER_STATS_SIZE
+        self._durations = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def connect(self):
+        markup_rendered.connect(self.record, dispatch_uid=id(self))
+
+    def disconnect(self):
+        markup_rendered.disconnect(dispatch_uid=id(self))
+
+    def record(self, sender, filter, duration, cache_hit, **kwargs):
+        key = (sender, filter)
+        with self._lock:
+            try:
+                durations = self._durations[key]
+            except KeyError:
+                durations = self._durations[key] = deque(maxlen=self.size)
+                self._counts[key] = [0, 0]
+            durations.append(duration)
+            self._counts[key][0] += 1
+            self._counts[key][1] += bool(cache_hit)
+
+    def percentiles(self, sender, filter, ps=(50, 90, 99)):
+        """
+        Return the ``ps`` percentiles of the recent render durations of
+        ``sender`` with ``filter``, keyed by ``'p50'`` etc.
+
+        """
+        with self._lock:
+            durations = sorted(self._durations.get((sender, filter), ()))
+        return dict(('p%s' % p, percentile(durations, p)) for p in ps)
+
+    def summary(self, ps=(50, 90, 99)):
+        """
+        Return the render count, cache hit count and duration
+        percentiles of each ``(sender, filter)``.
+
+        """
+        with self._lock:
+            keys = list(self._durations)
+        summary = {}
+        for key in keys:
+            count, cache_hits = self._counts[key]
+            summary[key] = dict(self.percentiles(*key, ps=ps),
+                                count=count, cache_hits=cache_hits)
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+
+
+render_stats = RenderStats()
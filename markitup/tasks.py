@@ -0,0 +1,107 @@
+"""
+background rendering for django-markitup
+
+A ``MarkupField(render_in_background=True)`` saves its raw markup
+right away, with ``PENDING`` in its rendered field, and hands the
+render over to the queue selected by the MARKITUP_BACKGROUND_QUEUE
+setting once the transaction commits. Until the rendered field is
+filled in, reading the rendered markup renders it in the request.
+
+The setting is the dotted path to a class with an
+``enqueue(model_label, pk, field_name, using)`` method, which must
+eventually call ``render_pending`` with the same arguments:
+
+* ``markitup.tasks.ThreadPoolQueue`` (the default) renders in a pool
+  of ``MARKITUP_BACKGROUND_WORKERS`` threads of the current process.
+
+* ``markitup.tasks.InlineQueue`` renders right away, after the commit.
+
+To use an external task queue, write a class whose ``enqueue`` method
+sends a task (e.g. a Celery task) that calls ``render_pending``.
+
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.db import close_old_connections
+
+from markitup import settings
+from markitup.filters import import_filter
+
+logger = logging.getLogger(__name__)
+
+# stored in the rendered field until the background render is done
+PENDING = '<!-- markitup:pending -->'
+
+
+def render_pending(model_label, pk, field_name, using):
+    """
+    Render the markup of ``field_name`` of the ``model_label`` row with
+    primary key ``pk`` in the database ``using``, if its rendered field
+    is still pending.
+
+    """
+    model = apps.get_model(model_label)
+    field = model._meta.get_field(field_name)
+    rendered_name = '_%s_rendered' % field.attname
+    pending = model._base_manager.using(using).filter(
+        pk=pk, **{rendered_name: PENDING})
+    raw = pending.values_list(field.attname, flat=True).first()
+    if raw is None:
+        return
+    # the row may have been saved again in the meantime
+    pending.filter(**{field.attname: raw}).update(
+        **{rendered_name: field.render(raw)})
+
+
+class InlineQueue(object):
+    """
+    Renders in the calling thread.
+
+    """
+    def enqueue(self, model_label, pk, field_name, using):
+        render_pending(model_label, pk, field_name, using)
+
+
+def _render_in_thread(*args):
+    try:
+        render_pending(*args)
+    except Exception:
+        logger.exception("Rendering %s %s %s failed", *args[:3])
+    finally:
+        close_old_connections()
+
+
+class ThreadPoolQueue(object):
+    """
+    Renders in a pool of threads of the current process.
+
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or settings.MARKITUP_BACKGROUND_WORKERS
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, model_label, pk, field_name, using):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix='markitup')
+        return self._executor.submit(
+            _render_in_thread, model_label, pk, field_name, using)
+
+
+def get_queue(dotted_path=None):
+    """
+    Return a new instance of the queue class at ``dotted_path``, by
+    default the MARKITUP_BACKGROUND_QUEUE setting.
+
+    """
+    return import_filter(dotted_path or settings.MARKITUP_BACKGROUND_QUEUE)()
+
+
+background_queue = get_queue()
@@ -6,16 +6,33 @@ try:
 except ImportError:
     from django.core.urlresolvers import reverse, NoReverseMatch
 from markitup import settings
+from markitup.bundle import bundle_urls
+from markitup.cache import get_render_cache, render_key
 from markitup.util import absolute_url
-from markitup.fields import render_func
+from markitup.fields import default_filter
+from markitup.filters import resolve_filter
+from markitup.signals import timed_render
 
 
 register = template.Library()
 
+render_cache = get_render_cache(settings.MARKITUP_RENDER_CACHE)
+
 
 @register.filter
-def render_markup(content):
-    return render_func(content)
+def render_markup(content, filter_name=None):
+    func, config = resolve_filter(filter_name, default_filter)
+    return timed_render('render_markup', filter_name or config[0], func,
+                        content)
+
+
+@register.filter
+def render_markup_cached(content, filter_name=None):
+    if render_cache is None or not isinstance(content, str):
+        return render_markup(content, filter_name)
+    func, config = resolve_filter(filter_name, default_filter)
+    return timed_render('render_markup', filter_name or config[0], func,
+                        content, render_cache, render_key(content, *config))
 
 
 
@@ -35,24 +52,33 @@ def _get_markitup_context():
 register._markitup_context = _get_markitup_context()
 
 
+def _media_context(**kwargs):
+    context = dict(register._markitup_context, **kwargs)
+    if settings.MARKITUP_BUNDLE:
+        urls = bundle_urls(settings.MARKITUP_SET, settings.MARKITUP_SKIN)
+        if urls is not None:
+            context['BUNDLE_JS'], context['BUNDLE_CSS'] = urls
+    return context
+
+
 
 @register.inclusion_tag('markitup/include_all.html')
 def markitup_media(no_jquery=False):
     include_jquery = not bool(no_jquery) and settings.JQUERY_URL is not None
-    return dict(register._markitup_context, include_jquery=include_jquery)
+    return _media_context(include_jquery=include_jquery)
 
 
 
 @register.inclusion_tag('markitup/include_js.html')
 def markitup_js(no_jquery=False):
     include_jquery = not bool(no_jquery) and settings.JQUERY_URL is not None
-    return dict(register._markitup_context, include_jquery=include_jquery)
+    return _media_context(include_jquery=include_jquery)
 
 
 
 @register.inclusion_tag('markitup/include_css.html')
 def markitup_css():
-    return register._markitup_context
+    return _media_context()
 
 
 
@@ -68,6 +94,25 @@ def markitup_editor(textarea_id, auto_preview=None):
     except NoReverseMatch:
        preview_url = None;
 
+    preview_blocks_url = None
+    if settings.MARKITUP_PREVIEW_BLOCKS:
+        try:
+            preview_blocks_url = reverse('markitup_preview_blocks')
+        except NoReverseMatch:
+            pass
+
+    preview_fragment_url = None
+    if settings.MARKITUP_PREVIEW_FRAGMENTS:
+        try:
+            preview_fragment_url = reverse('markitup_preview_fragment')
+        except NoReverseMatch:
+            pass
+
     return {'textarea_id': textarea_id,
             'AUTO_PREVIEW': auto_preview,
-            'preview_url': preview_url}
+            'LAZY': settings.MARKITUP_LAZY,
+            'PREVIEW_DEBOUNCE': settings.MARKITUP_PREVIEW_DEBOUNCE,
+            'PREVIEW_THROTTLE': settings.MARKITUP_PREVIEW_THROTTLE,
+            'preview_url': preview_url,
+            'preview_blocks_url': preview_blocks_url,
+            'preview_fragment_url': preview_fragment_url}
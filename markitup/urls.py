@@ -2,8 +2,22 @@ from __future__ import unicode_literals
 
 from django.urls import re_path
 
-from markitup.views import apply_filter
+from markitup import settings
+from markitup.views import (apply_filter, apply_filter_async,
+                            apply_filter_blocks, apply_filter_fragment,
+                            bundle)
+
+if settings.MARKITUP_PREVIEW_ASYNC:
+    preview_view = apply_filter_async
+else:
+    preview_view = apply_filter
 
 urlpatterns = [
-    re_path(r'preview/$', apply_filter, name='markitup_preview'),
+    re_path(r'preview/$', preview_view, name='markitup_preview'),
+    re_path(r'preview/blocks/$', apply_filter_blocks,
+            name='markitup_preview_blocks'),
+    re_path(r'preview/fragment/$', apply_filter_fragment,
+            name='markitup_preview_fragment'),
+    re_path(r'bundle/(?P<digest>[0-9a-f]+)\.(?P<kind>js|css)$', bundle,
+            name='markitup_bundle'),
 ]
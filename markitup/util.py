@@ -1,9 +1,27 @@
 from __future__ import unicode_literals
 
 from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# settings that change the URLs of static files
+STATIC_SETTINGS = ('STATIC_URL', 'STATIC_ROOT', 'STATICFILES_STORAGE',
+                   'STORAGES')
+
+# resolved static URLs, by path
+_urls = {}
 
 
 def absolute_url(path):
     if path.startswith(u'http://') or path.startswith(u'https://') or path.startswith(u'/'):
         return path
-    return staticfiles_storage.url(path)
+    try:
+        return _urls[path]
+    except KeyError:
+        return _urls.setdefault(path, staticfiles_storage.url(path))
+
+
+@receiver(setting_changed)
+def _reset_urls(setting, **kwargs):
+    if setting in STATIC_SETTINGS:
+        _urls.clear()
@@ -1,11 +1,330 @@
 from __future__ import unicode_literals
 
+import asyncio
+import hashlib
+import itertools
+import json
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.html import escape
 from django.shortcuts import render
+from django.template.loader import render_to_string
 
 from markitup import settings
-from markitup.markup import filter_func
+from markitup import markup
+from markitup.backends import RenderQueueFull, RenderTimeout
+from markitup.blocks import block_id, unwrap
+from markitup.bundle import get_bundle
+from markitup.cache import get_cache
+from markitup.filters import get_filter_config
+
+# stands in for the rendered markup in the streamed preview template
+PREVIEW_MARKER = '<!-- markitup:preview -->'
+
+
+def _start(chunks):
+    """
+    Return an iterator over ``chunks`` once the first one is rendered,
+    so that a busy or timed out render backend fails before a response
+    starts streaming.
+
+    """
+    chunks = iter(chunks)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], chunks)
+
+
+def _stream_preview(request, data, filter_name=None):
+    page = render_to_string('markitup/preview.html',
+                            {'preview': PREVIEW_MARKER}, request)
+    head, marker, tail = page.partition(PREVIEW_MARKER)
+    if not marker:
+        # the template doesn't output the preview unescaped
+        return [render_to_string('markitup/preview.html',
+                                 {'preview': markup.render_preview(
+                                     data, filter_name)},
+                                 request)]
+    return itertools.chain(
+        [head], _start(markup.iter_preview(data, filter_name)), [tail])
+
+
+# recent sources of the incremental preview, by revision
+_sources = get_cache(settings.MARKITUP_PREVIEW_SOURCE_CACHE)
+
+# executor and per-event-loop semaphores of the async preview view
+_executor = None
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if settings.MARKITUP_PREVIEW_EXECUTOR == 'process':
+            executor_class = ProcessPoolExecutor
+        else:
+            executor_class = ThreadPoolExecutor
+        _executor = executor_class(settings.MARKITUP_PREVIEW_WORKERS)
+    return _executor
+
+
+def _get_semaphore(loop):
+    try:
+        return _semaphores[loop]
+    except KeyError:
+        semaphore = asyncio.Semaphore(settings.MARKITUP_PREVIEW_CONCURRENCY)
+        _semaphores[loop] = semaphore
+        return semaphore
+
+
+def _check_size(data):
+    max_size = settings.MARKITUP_PREVIEW_MAX_SIZE
+    if max_size is not None and len(data) > max_size:
+        return HttpResponse('Preview data too large.', status=413,
+                            content_type='text/plain')
+
+
+def _get_filter_name(request):
+    """
+    Return the name of the filter requested with the ``filter``
+    parameter, if any, or raise ``ImproperlyConfigured`` if there's no
+    such filter in the MARKITUP_FILTERS setting.
+
+    """
+    filter_name = request.GET.get('filter') or request.POST.get('filter')
+    if filter_name:
+        get_filter_config(filter_name)
+        return filter_name
+    return None
+
+
+def _unknown_filter():
+    return HttpResponseBadRequest('Unknown filter.')
+
+
+def _busy():
+    return HttpResponse('Too many previews.', status=503,
+                        content_type='text/plain')
+
+
+def _timed_out():
+    return HttpResponse('Preview timed out.', status=504,
+                        content_type='text/plain')
 
 
 def apply_filter(request):
-    markup = filter_func(request.POST.get('data', ''))
-    return render(request, 'markitup/preview.html', {'preview': markup})
+    data = request.POST.get('data', '')
+    response = _check_size(data)
+    if response is not None:
+        return response
+    try:
+        filter_name = _get_filter_name(request)
+    except ImproperlyConfigured:
+        return _unknown_filter()
+    try:
+        if settings.MARKITUP_PREVIEW_STREAM:
+            return StreamingHttpResponse(
+                _stream_preview(request, data, filter_name))
+        preview = markup.render_preview(data, filter_name)
+    except RenderQueueFull:
+        return _busy()
+    except RenderTimeout:
+        return _timed_out()
+    return render(request, 'markitup/preview.html', {'preview': preview})
+
+
+def apply_filter_fragment(request):
+    """
+    Like ``apply_filter``, but return only the rendered markup, as HTML
+    or, if the ``format`` parameter is ``json``, as the ``html`` member
+    of a JSON object.
+
+    """
+    data = request.POST.get('data', '')
+    response = _check_size(data)
+    if response is not None:
+        return response
+    try:
+        filter_name = _get_filter_name(request)
+    except ImproperlyConfigured:
+        return _unknown_filter()
+    as_json = (request.GET.get('format') or
+               request.POST.get('format')) == 'json'
+    try:
+        if settings.MARKITUP_PREVIEW_STREAM and not as_json:
+            return StreamingHttpResponse(
+                _start(markup.iter_preview(data, filter_name)))
+        preview = markup.render_preview(data, filter_name)
+    except RenderQueueFull:
+        return _busy()
+    except RenderTimeout:
+        return _timed_out()
+    if as_json:
+        return JsonResponse({'html': preview})
+    return HttpResponse(preview)
+
+
+async def apply_filter_async(request):
+    """
+    Asynchronous version of ``apply_filter``, which renders in an
+    executor so that renders don't block the event loop.
+
+    """
+    # asgiref only comes with Django 3.0 and later
+    from asgiref.sync import sync_to_async
+
+    data = request.POST.get('data', '')
+    response = _check_size(data)
+    if response is not None:
+        return response
+    try:
+        filter_name = _get_filter_name(request)
+    except ImproperlyConfigured:
+        return _unknown_filter()
+
+    # get_running_loop() is new in Python 3.7; in a coroutine,
+    # get_event_loop() returns the running loop as well
+    loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+    semaphore = _get_semaphore(loop)
+    timeout = settings.MARKITUP_PREVIEW_TIMEOUT
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout)
+    except asyncio.TimeoutError:
+        return _busy()
+
+    def release(future):
+        # a render that timed out still holds its slot until it finishes
+        semaphore.release()
+        if not future.cancelled():
+            future.exception()
+
+    future = loop.run_in_executor(_get_executor(), markup.render_preview,
+                                  data, filter_name)
+    future.add_done_callback(release)
+    try:
+        preview = await asyncio.wait_for(asyncio.shield(future), timeout)
+    except (asyncio.TimeoutError, RenderTimeout):
+        return _timed_out()
+    except RenderQueueFull:
+        return _busy()
+    return await sync_to_async(render)(
+        request, 'markitup/preview.html', {'preview': preview})
+
+
+def _revision(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _source_key(revision):
+    return 'markitup:source:%s' % revision
+
+
+def _single_block(text):
+    return [text]
+
+
+def apply_filter_blocks(request):
+    """
+    Incremental preview view.
+
+    The first request of an editor posts the whole markup as ``data``,
+    and gets back the preview page (``page``), the ``revision`` of the
+    markup, and the ids of its top-level ``blocks``. Later requests
+    post the revision they are based on as ``base``, and the change to
+    its markup as a JSON ``delta`` list ``[start, end, text]`` (the
+    text replacing the characters from ``start`` to ``end``). They get
+    back the new revision and block ids, and the rendered ``html`` of
+    the blocks that aren't in the base revision. A request based on a
+    revision the server no longer knows gets a ``409`` response.
+
+    Documents are split into blocks according to the preview filter
+    (see ``markitup.blocks.get_syntax``), and are a single block if
+    their filter is neither reStructuredText nor Markdown.
+
+    """
+    try:
+        filter_name = _get_filter_name(request)
+    except ImproperlyConfigured:
+        return _unknown_filter()
+    syntax = markup.get_preview_syntax(filter_name)
+    split = syntax.split if syntax is not None else _single_block
+    document = syntax.document if syntax is not None else None
+    base = request.POST.get('base')
+    if base:
+        source = _sources.get(_source_key(base))
+        if source is None:
+            return JsonResponse({'error': 'Unknown base revision.'},
+                                status=409)
+        try:
+            start, end, text = json.loads(request.POST['delta'])
+            if not 0 <= start <= end <= len(source):
+                raise ValueError
+            data = source[:start] + text + source[end:]
+        except (KeyError, TypeError, ValueError):
+            return HttpResponseBadRequest('Invalid delta.')
+        known = set(block_id(block) for block in split(source))
+    else:
+        data = request.POST.get('data', '')
+        known = set()
+    response = _check_size(data)
+    if response is not None:
+        return response
+
+    revision = _revision(data)
+    _sources.set(_source_key(revision), data)
+    blocks = split(data)
+    ids = [block_id(block) for block in blocks]
+    html = {}
+    # blocks rendered as whole documents, e.g. in <div class="document">
+    enclosed = True
+    try:
+        for block, id in zip(blocks, ids):
+            if id not in known and id not in html:
+                html[id] = markup.render_preview_block(block, filter_name)
+                if document is not None:
+                    content = unwrap(html[id], document)
+                    if content is None:
+                        enclosed = False
+                    else:
+                        html[id] = content
+    except RenderQueueFull:
+        return _busy()
+    except RenderTimeout:
+        return _timed_out()
+
+    result = {'revision': revision, 'blocks': ids}
+    if base:
+        result['html'] = html
+    else:
+        preview = ''.join(
+            '<div class="markitup-block" data-block="%s">%s</div>' % (
+                escape(id), html[id]) for id in ids)
+        preview = '<div class="markitup-blocks">%s</div>' % preview
+        if document is not None and enclosed:
+            preview = document[0] + preview + document[1]
+        result['page'] = render_to_string(
+            'markitup/preview.html', {'preview': preview}, request)
+    return JsonResponse(result)
+
+
+def bundle(request, digest, kind):
+    found = get_bundle(kind, request.GET.get('set'), request.GET.get('skin'))
+    if found is None or found.digest != digest:
+        raise Http404
+    content, encoding = found.encoded(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = HttpResponse(content, content_type=found.content_type)
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    # the URL changes with the content
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60,
+                        immutable=True)
+    return response
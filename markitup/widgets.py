@@ -3,13 +3,18 @@ from __future__ import unicode_literals
 import posixpath
 from django import forms
 from django.contrib.admin.widgets import AdminTextareaWidget
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.template.loader import render_to_string
 try:
     from django.urls import NoReverseMatch, reverse_lazy
 except ImportError:
     from django.core.urlresolvers import NoReverseMatch, reverse_lazy
+from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
+from django.utils.text import format_lazy
 from markitup import settings
+from markitup.bundle import bundle_urls
 from markitup.util import absolute_url
 
 
@@ -39,7 +44,7 @@ class MarkItUpWidget(MarkupTextarea):
     """
     Widget for a MarkItUp editor textarea.
 
-    Takes two additional optional keyword arguments:
+    Takes additional optional keyword arguments:
 
     ``markitup_set``
         URL path (absolute or relative to STATIC_URL) to MarkItUp
@@ -49,13 +54,36 @@ class MarkItUpWidget(MarkupTextarea):
         URL path (absolute or relative to STATIC_URL) to MarkItUp skin
         directory.  Default: value of MARKITUP_SKIN setting.
 
+    ``lazy``
+        Build the editor when the textarea gains focus or scrolls into
+        view, instead of when the page loads.  Default: value of
+        MARKITUP_LAZY setting.
+
+    ``preview_debounce``
+        Milliseconds to wait for edits to stop before refreshing the
+        preview.  Default: value of MARKITUP_PREVIEW_DEBOUNCE setting.
+
+    ``preview_throttle``
+        Minimum milliseconds between preview requests.  Default: value
+        of MARKITUP_PREVIEW_THROTTLE setting.
+
+    ``preview_filter``
+        Name of the filter in the MARKITUP_FILTERS setting used by the
+        preview.  Default: the MARKITUP_PREVIEW_FILTER setting.
+
     """
     def __init__(self, attrs=None,
                  markitup_set=None,
                  markitup_skin=None,
-                 auto_preview=None):
-        self.miu_set = absolute_url(markitup_set or settings.MARKITUP_SET)
-        self.miu_skin = absolute_url(markitup_skin or settings.MARKITUP_SKIN)
+                 auto_preview=None,
+                 preview_debounce=None,
+                 preview_throttle=None,
+                 preview_filter=None,
+                 lazy=None):
+        self.miu_set_path = markitup_set or settings.MARKITUP_SET
+        self.miu_skin_path = markitup_skin or settings.MARKITUP_SKIN
+        self.miu_set = absolute_url(self.miu_set_path)
+        self.miu_skin = absolute_url(self.miu_skin_path)
         if auto_preview is None:
             auto_preview = settings.MARKITUP_AUTO_PREVIEW
         self.auto_preview = auto_preview
@@ -64,26 +92,83 @@ class MarkItUpWidget(MarkupTextarea):
             preview_url = reverse_lazy('markitup_preview')
         except NoReverseMatch:
             preview_url = ""
+        preview_blocks_url = ""
+        if settings.MARKITUP_PREVIEW_BLOCKS:
+            try:
+                preview_blocks_url = reverse_lazy('markitup_preview_blocks')
+            except NoReverseMatch:
+                pass
+        preview_fragment_url = ""
+        if settings.MARKITUP_PREVIEW_FRAGMENTS:
+            try:
+                preview_fragment_url = reverse_lazy(
+                    'markitup_preview_fragment')
+            except NoReverseMatch:
+                pass
+
+        if preview_filter is not None:
+            query = urlencode({'filter': preview_filter})
+            if preview_url:
+                preview_url = format_lazy('{}?{}', preview_url, query)
+            if preview_blocks_url:
+                preview_blocks_url = format_lazy('{}?{}', preview_blocks_url,
+                                                 query)
+            if preview_fragment_url:
+                preview_fragment_url = format_lazy(
+                    '{}?{}', preview_fragment_url, query)
 
         attrs = attrs or {}
         classes = attrs.get('class', '').split()
         attrs['class'] = ' '.join(classes + ['django-markitup-widget'])
         attrs['data-preview-url'] = preview_url
+        if preview_blocks_url:
+            attrs['data-preview-blocks-url'] = preview_blocks_url
+        if preview_fragment_url:
+            attrs['data-preview-fragment-url'] = preview_fragment_url
         if auto_preview:
             attrs['data-auto-preview'] = '1'
+        if lazy is None:
+            lazy = settings.MARKITUP_LAZY
+        if lazy:
+            attrs['data-lazy'] = '1'
+        if preview_debounce is None:
+            preview_debounce = settings.MARKITUP_PREVIEW_DEBOUNCE
+        if preview_throttle is None:
+            preview_throttle = settings.MARKITUP_PREVIEW_THROTTLE
+        attrs['data-preview-debounce'] = preview_debounce
+        attrs['data-preview-throttle'] = preview_throttle
 
         super(MarkItUpWidget, self).__init__(attrs)
 
+    # forms.Media by (set, skin, JQUERY_URL, MARKITUP_BUNDLE), reset on
+    # setting changes
+    _media_cache = {}
+
     def _media(self):
+        key = (self.miu_set_path, self.miu_skin_path, settings.JQUERY_URL,
+               settings.MARKITUP_BUNDLE)
+        try:
+            return self._media_cache[key]
+        except KeyError:
+            pass
         js_media = [absolute_url(settings.JQUERY_URL)] if settings.JQUERY_URL is not None else []
-        js_media = js_media + [absolute_url('markitup/ajax_csrf.js'),
-                               absolute_url('markitup/jquery.markitup.js'),
-                               posixpath.join(self.miu_set, 'set.js'),
-                               absolute_url('markitup/django-markitup.js')]
-        return forms.Media(
-            css={'screen': (posixpath.join(self.miu_skin, 'style.css'),
-                            posixpath.join(self.miu_set, 'style.css'))},
-            js=js_media)
+        urls = None
+        if settings.MARKITUP_BUNDLE:
+            urls = bundle_urls(self.miu_set_path, self.miu_skin_path)
+        if urls is not None:
+            js_url, css_url = urls
+            media = forms.Media(css={'screen': (css_url,)},
+                                js=js_media + [js_url])
+        else:
+            js_media = js_media + [absolute_url('markitup/ajax_csrf.js'),
+                                   absolute_url('markitup/jquery.markitup.js'),
+                                   posixpath.join(self.miu_set, 'set.js'),
+                                   absolute_url('markitup/django-markitup.js')]
+            media = forms.Media(
+                css={'screen': (posixpath.join(self.miu_skin, 'style.css'),
+                                posixpath.join(self.miu_set, 'style.css'))},
+                js=js_media)
+        return self._media_cache.setdefault(key, media)
     media = property(_media)
 
 
@@ -94,3 +179,10 @@ class AdminMarkItUpWidget(MarkItUpWidget, AdminTextareaWidget):
 
     """
     pass
+
+
+@receiver(setting_changed)
+def _reset_media(**kwargs):
+    # the media of each widget depends on several settings, and on the
+    # static files storage through absolute_url
+    MarkItUpWidget._media_cache.clear()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Run the benchmarks in tests/benchmarks.py.
+
+    ./runbenchmarks.py --output results.json
+    ./runbenchmarks.py --baseline results.json --threshold 0.1
+
+exits with status 1 if any benchmark got slower than in the baseline
+by more than the threshold.
+
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def parse_size(value):
+    value = value.upper()
+    for suffix, factor in (('MB', 1024 * 1024), ('KB', 1024)):
+        if value.endswith(suffix):
+            return int(value[:-len(suffix)]) * factor
+    return int(value)
+
+
+def runbenchmarks(argv):
+    parser = argparse.ArgumentParser(description="Run the benchmarks.")
+    parser.add_argument('only', nargs='*',
+                        help="Only run benchmarks whose name contains one "
+                             "of these strings.")
+    parser.add_argument('--sizes', default='1KB,10KB,100KB,1MB',
+                        help="Document sizes (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Timings per benchmark (default: %(default)s).")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Minimum seconds per timing "
+                             "(default: %(default)s).")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline',
+                        help="Compare the results to this JSON file.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Slowdown over the baseline reported as a "
+                             "regression (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.test_settings'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import django
+    django.setup()
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+    from tests.benchmarks import BENCHMARKS, Runner, compare
+
+    runner = Runner([parse_size(size) for size in args.sizes.split(',')],
+                    repeat=args.repeat, min_time=args.min_time,
+                    only=args.only or None, stream=sys.stdout)
+    test_runner = DiscoverRunner(verbosity=0)
+    setup_test_environment()
+    old_config = test_runner.setup_databases()
+    try:
+        for benchmark in BENCHMARKS:
+            benchmark(runner)
+    finally:
+        test_runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+    results = {
+        'python': sys.version.split()[0],
+        'django': django.get_version(),
+        'results': runner.results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(runner.results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print("REGRESSION %s: %.6fs -> %.6fs (x%.2f)" % (
+                name, before, after, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(runbenchmarks(sys.argv[1:]))
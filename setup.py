@@ -24,7 +24,8 @@ setup(
     author='Carl Meyer',
     author_email='carl@oddbird.net',
     url='https://github.com/CTPUG/django-markitup',
-    packages=['markitup', 'markitup.templatetags'],
+    packages=['markitup', 'markitup.management',
+              'markitup.management.commands', 'markitup.templatetags'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Web Environment',
@@ -0,0 +1,235 @@
+"""
+Benchmarks for django-markitup, run with ``runbenchmarks.py``.
+
+Each benchmark function takes a ``Runner`` and times one or more
+callables with ``runner.time(name, func)``. Benchmarks that need a
+markup library that isn't installed are skipped.
+
+"""
+from __future__ import unicode_literals
+
+import itertools
+import statistics
+import time
+
+from django.template import Context, Template
+from django.test import Client
+from django.test.utils import override_settings
+
+from markitup.fields import _get_render_func
+
+from .models import Article, Post
+
+BENCHMARKS = []
+
+MARKDOWN = ('markdown.markdown', {})
+REST = ('markitup.renderers.render_rest', {})
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def size_label(size):
+    if size >= 1024 * 1024:
+        return '%dMB' % (size // (1024 * 1024))
+    return '%dKB' % (size // 1024)
+
+
+def markdown_document(size):
+    """
+    Return a Markdown document of about ``size`` characters.
+
+    """
+    section = ('## Section %d\n\n'
+               'Some *emphasized* text, a [link](http://example.com/) and '
+               '`inline code`, in a paragraph long enough to wrap.\n\n'
+               '- first item\n- second item with **strong** text\n\n'
+               '    indented code\n\n')
+    sections = []
+    length = 0
+    while length < size:
+        sections.append(section % len(sections))
+        length += len(sections[-1])
+    return ''.join(sections)
+
+
+def rest_document(size):
+    """
+    Return a reStructuredText document of about ``size`` characters.
+
+    """
+    section = ('Section %d\n============\n\n'
+               'Some *emphasized* text, a `link <http://example.com/>`__ '
+               'and ``inline code``, in a paragraph long enough to wrap.\n\n'
+               '- first item\n- second item with **strong** text\n\n'
+               '::\n\n    literal block\n\n')
+    sections = []
+    length = 0
+    while length < size:
+        sections.append(section % len(sections))
+        length += len(sections[-1])
+    return ''.join(sections)
+
+
+class Runner(object):
+    """
+    Times benchmarks, collecting results by name.
+
+    Each callable is called ``repeat`` times in a row of as many loops
+    as take at least ``min_time`` seconds; results are the best and
+    median seconds per call.
+
+    """
+    def __init__(self, sizes, repeat=5, min_time=0.2, only=None, stream=None):
+        self.sizes = sizes
+        self.repeat = repeat
+        self.min_time = min_time
+        self.only = only
+        self.stream = stream
+        self.results = {}
+
+    def wants(self, name):
+        return self.only is None or any(o in name for o in self.only)
+
+    def time(self, name, func):
+        if not self.wants(name):
+            return
+        loops = 1
+        while True:
+            elapsed = self._run(func, loops)
+            if elapsed >= self.min_time or loops >= 1 << 20:
+                break
+            loops *= 2 if elapsed * 10 >= self.min_time else 10
+        times = [elapsed / loops] + [
+            self._run(func, loops) / loops for i in range(self.repeat - 1)]
+        self.results[name] = {
+            'min': min(times),
+            'median': statistics.median(times),
+            'loops': loops,
+            'repeat': self.repeat,
+        }
+        if self.stream is not None:
+            self.stream.write('%-40s %12.6fs %12.6fs\n' % (
+                name, min(times), statistics.median(times)))
+
+    def _run(self, func, loops):
+        started = time.perf_counter()
+        for i in range(loops):
+            func()
+        return time.perf_counter() - started
+
+
+def _importable(filter_path):
+    # render_rest only imports docutils when called
+    try:
+        _get_render_func(filter_path)('')
+    except ImportError:
+        return False
+    return True
+
+
+def _markup_filters():
+    return [(name, config, document) for name, config, document in (
+        ('markdown', MARKDOWN, markdown_document),
+        ('rest', REST, rest_document),
+    ) if _importable(config[0])]
+
+
+@benchmark
+def render_func(runner):
+    for name, (path, kwargs), document in _markup_filters():
+        func = _get_render_func(path, **kwargs)
+        for size in runner.sizes:
+            text = document(size)
+            runner.time('render_func.%s[%s]' % (name, size_label(size)),
+                        lambda: func(text))
+
+
+@benchmark
+def pre_save(runner):
+    field = Post._meta.get_field('body')
+    for name, config, document in _markup_filters():
+        with override_settings(MARKITUP_FILTER=config):
+            # alternate raw values, so that each call renders
+            texts = itertools.cycle([document(1024), document(1024) + '\n'])
+            post = Post(title='benchmark')
+
+            def render():
+                post.body = next(texts)
+                field.pre_save(post, True)
+            runner.time('pre_save.%s[1KB]' % name, render)
+
+
+@benchmark
+def bulk_create(runner):
+    for name, config, document in _markup_filters():
+        with override_settings(MARKITUP_FILTER=config):
+            text = document(1024)
+
+            def create():
+                Article.objects.bulk_create([
+                    Article(title='benchmark', content=text, summary=text)
+                    for i in range(100)])
+            runner.time('bulk_create.%s[100x1KB]' % name, create)
+            Article.objects.all().delete()
+
+
+@benchmark
+def descriptor(runner):
+    post = Post.objects.create(title='benchmark', body='replace this text')
+
+    def access():
+        for i in range(1000):
+            post.body.rendered
+    runner.time('descriptor.rendered[1000]', access)
+
+    def assign():
+        for i in range(1000):
+            post.body = 'replace this text'
+    runner.time('descriptor.assign[1000]', assign)
+    post.delete()
+
+
+@benchmark
+def render_markup(runner):
+    template = Template('{% load markitup_tags %}'
+                        '{% for text in texts %}{{ text|render_markup }}'
+                        '{% endfor %}')
+    for name, config, document in _markup_filters():
+        with override_settings(MARKITUP_FILTER=config):
+            context = Context({'texts': [document(1024)] * 100})
+            runner.time('render_markup.%s[100x1KB]' % name,
+                        lambda: template.render(context))
+
+
+@benchmark
+def apply_filter(runner):
+    client = Client()
+    for name, config, document in _markup_filters():
+        with override_settings(MARKITUP_PREVIEW_FILTER=config):
+            for size in runner.sizes:
+                data = {'data': document(size)}
+                runner.time(
+                    'apply_filter.%s[%s]' % (name, size_label(size)),
+                    lambda: client.post('/markitup/preview/', data))
+
+
+def compare(results, baseline, threshold):
+    """
+    Return ``(name, baseline, current, ratio)`` for the benchmarks in
+    both ``results`` and ``baseline`` whose median time grew by more
+    than ``threshold`` (e.g. ``0.1`` for 10%).
+
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        try:
+            before = baseline[name]['median']
+        except KeyError:
+            continue
+        ratio = result['median'] / before if before else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((name, before, result['median'], ratio))
+    return regressions
@@ -1,3 +1,3 @@
-from .filter import testfilter, testfilter_upper
+from .filter import testfilter, testfilter_upper, testfilter_slow
 
-__all__ = [testfilter, testfilter_upper]
+__all__ = [testfilter, testfilter_upper, testfilter_slow]
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+import time
+
 
 def testfilter(s, arg=None):
     return s.replace('replace this', arg)
@@ -9,3 +11,8 @@ def testfilter_upper(s, skip=None):
     if skip is None:
         skip = []
     return ''.join(ch.upper() if ch not in skip else ch for ch in s)
+
+
+def testfilter_slow(s, seconds=0):
+    time.sleep(seconds)
+    return s
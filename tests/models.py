@@ -1,6 +1,7 @@
 from django.db import models
 
 from markitup.fields import MarkupField
+from markitup.managers import MarkupManager
 
 
 class Post(models.Model):
@@ -18,6 +19,17 @@ class AbstractParent(models.Model):
         abstract = True
 
 
+class Article(AbstractParent):
+    """
+    Test bulk operations through MarkupManager, including on a
+    MarkupField inherited from an abstract parent.
+    """
+    title = models.CharField(max_length=50)
+    summary = MarkupField(blank=True)
+
+    objects = MarkupManager()
+
+
 class NoRendered(models.Model):
     """
     Test that the no_rendered_field keyword arg works.
@@ -30,3 +42,58 @@ class CallableDefault(models.Model):
     A callable default on a field triggers hidden widget rendering by Django.
     """
     body = MarkupField(default=lambda: '')
+
+
+class AlwaysRender(models.Model):
+    """
+    Test that the always_render keyword arg works.
+    """
+    body = MarkupField(always_render=True)
+
+
+class RenderOnRead(models.Model):
+    """
+    Test that the render_on_read and render_cache keyword args work.
+    """
+    body = MarkupField(no_rendered_field=True, render_on_read=True,
+                       render_cache='local')
+
+
+class BackgroundRender(models.Model):
+    """
+    Test that the render_in_background keyword arg works.
+    """
+    body = MarkupField(render_in_background=True)
+
+
+class NamedFilter(models.Model):
+    """
+    Test that the filter keyword arg works.
+    """
+    body = MarkupField(filter='upper')
+
+
+class DeferRendered(models.Model):
+    """
+    Test that the defer_rendered keyword arg works.
+    """
+    body = MarkupField(defer_rendered=True)
+
+    objects = MarkupManager()
+
+
+class PublishedManager(models.Manager):
+    def get_queryset(self):
+        return super(PublishedManager, self).get_queryset().filter(
+            published=True)
+
+
+class Published(models.Model):
+    """
+    Test that rerender_markup also renders the rows hidden by the
+    default manager.
+    """
+    published = models.BooleanField(default=False)
+    body = MarkupField()
+
+    objects = PublishedManager()
@@ -45,6 +45,9 @@ ROOT_URLCONF = "tests.urls"
 
 # Use str so this isn't unicode on python 2
 MARKITUP_FILTER = (str("tests.filter.testfilter"), {"arg": "replacement"})
+MARKITUP_FILTERS = {
+    "upper": (str("tests.filter.testfilter_upper"), {}),
+}
 
 SECRET_KEY = 'test-secret'
 
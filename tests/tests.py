@@ -1,23 +1,70 @@
 from __future__ import unicode_literals
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from functools import partial
+import gc
+import gzip
 import json
+import pickle
+import time
+from urllib.parse import urlencode
 import re
+import threading
+import weakref
+
+from io import StringIO
+from unittest import skipUnless
 
 from django.core import serializers
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_save
+from django.core.management import CommandError, call_command
 from django.forms.models import modelform_factory
 from django.template import Template, Context
-from django.test import TestCase, Client
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase)
+try:
+    from django.test import AsyncRequestFactory
+except ImportError:
+    # Django < 3.1 has no async views
+    AsyncRequestFactory = None
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
-from django.test.utils import override_settings
+from django.test.utils import isolate_apps, override_settings
 from django.utils.version import get_version, get_version_tuple
+from django.utils.translation import gettext_lazy
 
 from django.contrib import admin
 
-from markitup import settings
+from markitup import (blocks, bundle, fields, filters, markup, renderers, settings,
+                      tasks, views)
+from markitup.backends import (ProcessPoolBackend, RenderQueueFull,
+                               RenderTimeout)
+from markitup.cache import (LocalCache, RenderCache, get_render_cache,
+                            render_key)
+from markitup.signals import markup_rendered, timed_render
+from markitup.stats import RenderStats, percentile
 from markitup.templatetags import markitup_tags
 from markitup.widgets import MarkItUpWidget, MarkupTextarea, AdminMarkItUpWidget
 
-from .models import Post, AbstractParent, CallableDefault
+from .models import (Post, AbstractParent, CallableDefault, AlwaysRender,
+                     Article, NoRendered, RenderOnRead, DeferRendered,
+                     BackgroundRender, NamedFilter, Published)
+
+try:
+    import docutils
+    renderers_has_rest = True
+except ImportError:
+    renderers_has_rest = False
+
+try:
+    import markdown
+    has_markdown = True
+except ImportError:
+    has_markdown = False
 
 
 
@@ -84,6 +131,33 @@ class MarkupFieldTests(TestCase):
         self.assertEqual(str(self.post.body),
                          u'new text, replacement')
 
+    def testMarkupIsReused(self):
+        self.assertIs(self.post.body, self.post.body)
+
+    def testMarkupKeepsInstanceAlive(self):
+        self.assertEqual(Post(body='replace this').body.raw, 'replace this')
+
+    def testMarkupCycleIsCollected(self):
+        post = Post(title='post', body='replace this text')
+        post.body.raw
+        ref = weakref.ref(post)
+        del post
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def testMarkupIsNotSharedWithCopies(self):
+        body = self.post.body
+        post = copy.copy(self.post)
+        self.assertIsNot(post.body, body)
+        post.body.raw = 'replace this copy'
+        self.assertEqual(self.post.body.raw, 'replace this text')
+
+    def testAssignInvalidatesMarkup(self):
+        body = self.post.body
+        self.post.body = 'new text'
+        self.assertIsNot(self.post.body, body)
+        self.assertEqual(self.post.body.raw, 'new text')
+
     def testAssignToRendered(self):
         def _invalid_assignment():
             self.post.body.rendered = 'this should fail'
@@ -99,6 +173,7 @@ class MarkupFieldTests(TestCase):
         self.post.body = mark_safe(self.post.body)
         self.assertEqual(self.post.body.raw, 'replace this text')
 
+    @isolate_apps('tests')
     def testAbstractInheritance(self):
         """
         Inheriting from an abstract parent class with a MarkupField should not
@@ -120,6 +195,597 @@ class MarkupFieldTests(TestCase):
         self.post.body.render_with(str('tests.filter.testfilter_upper'))
         self.assertEquals(str(self.post.body), "REPLACE THIS TEXT")
 
+    @skipUnless(has_markdown, 'markdown is not installed')
+    def testPickleWithBlockRenderer(self):
+        settings.MARKITUP_RENDER_BLOCKS = True
+        try:
+            # resolve render_func again, as a BlockRenderer
+            with override_settings(MARKITUP_FILTER=(
+                    str('markdown.markdown'), {})):
+                self.assertIsInstance(fields.get_render_func(),
+                                      blocks.BlockRenderer)
+                self.post.body = 'replace this\n\nreplace that'
+                self.post.save()
+                post = pickle.loads(pickle.dumps(
+                    Post.objects.get(pk=self.post.pk)))
+                pickle.loads(pickle.dumps(self.post))
+                self.assertEqual(post.body.rendered,
+                                 self.post.body.rendered)
+        finally:
+            settings.MARKITUP_RENDER_BLOCKS = False
+
+    def testRenderWithResolvesOnce(self):
+        func = fields._get_render_func('tests.filter.testfilter_upper',
+                                       skip=['a', 's'])
+        self.assertIs(fields._get_render_func(
+            'tests.filter.testfilter_upper', skip=['a', 's']), func)
+        self.assertIsNot(fields._get_render_func(
+            'tests.filter.testfilter_upper', skip=('a', 's')), func)
+        self.assertIsNot(fields._get_render_func(
+            'tests.filter.testfilter_upper', skip=['a']), func)
+
+    def testRenderWithBatch(self):
+        markups = [self.post.body, self.empty_post.body]
+        fields.render_with(markups, 'tests.filter.testfilter_upper',
+                           skip=['a'])
+        self.assertEqual(str(self.post.body), "REPLaCE THIS TEXT")
+        self.assertEqual(str(self.empty_post.body), "")
+        with ThreadPoolExecutor(2) as executor:
+            fields.render_with(markups, 'tests.filter.testfilter',
+                               executor=executor, arg='replaced')
+        self.assertEqual(str(self.post.body), "replaced text")
+
+
+class MarkupFieldRenderOnSaveTests(TestCase):
+    def setUp(self):
+        self.post = Post.objects.create(title='example post',
+                                        body='replace this text')
+        self.renders = []
+        self._old_render_func = fields.render_func
+
+        def counting_render_func(text):
+            self.renders.append(text)
+            return self._old_render_func(text)
+        fields.render_func = counting_render_func
+
+    def tearDown(self):
+        fields.render_func = self._old_render_func
+
+    def testUnchangedRawIsNotRendered(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'new title'
+        post.save()
+        self.assertEqual(self.renders, [])
+        self.assertEqual(Post.objects.get(pk=post.pk).body.rendered,
+                         'replacement text')
+
+    def testChangedRawIsRendered(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.body = 'replace this other text'
+        post.save()
+        post.save()
+        self.assertEqual(self.renders, ['replace this other text'])
+        self.assertEqual(Post.objects.get(pk=post.pk).body.rendered,
+                         'replacement other text')
+
+    def testSameRawIsNotRendered(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.body = 'replace this text'
+        post.save()
+        self.assertEqual(self.renders, [])
+
+    def testNewInstanceIsRendered(self):
+        post = Post(title='new', body='replace this text',
+                    _body_rendered='stale')
+        post.save()
+        self.assertEqual(self.renders, ['replace this text'])
+        self.assertEqual(post.body.rendered, 'replacement text')
+
+    def testLoadedRawIsPlainStr(self):
+        self.assertIs(type(Post.objects.get(pk=self.post.pk).body.raw), str)
+        self.assertIs(type(Post.objects.values_list('body', flat=True)[0]),
+                      str)
+        self.assertIs(type(Post.objects.values('body')[0]['body']), str)
+
+    def testChangedFilterIsRendered(self):
+        post = Post.objects.get(pk=self.post.pk)
+        with override_settings(
+                MARKITUP_FILTER=('tests.filter.testfilter_upper', {})):
+            post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).body.rendered,
+                         'REPLACE THIS TEXT')
+
+    def testPickledInstanceIsNotRendered(self):
+        post = pickle.loads(pickle.dumps(Post.objects.get(pk=self.post.pk)))
+        self.renders = []
+        post.save()
+        self.assertEqual(self.renders, [])
+
+    def testRenderWithIsOverwrittenOnSave(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.body.render_with(str('tests.filter.testfilter_upper'))
+        post.save()
+        self.assertEqual(post.body.rendered, 'replacement text')
+
+    def testAssignFromLoadedInstance(self):
+        other = Post.objects.create(title='other', body='replace this')
+        self.renders = []
+        post = Post.objects.get(pk=self.post.pk)
+        post.body = Post.objects.get(pk=other.pk).body
+        post.save()
+        self.assertEqual(self.renders, [])
+        self.assertEqual(post.body.rendered, 'replacement')
+
+    def testAlwaysRender(self):
+        obj = AlwaysRender.objects.create(body='replace this')
+        AlwaysRender.objects.get(pk=obj.pk).save()
+        self.assertEqual(self.renders, ['replace this', 'replace this'])
+
+
+# Django < 3.2 can't capture on_commit callbacks in a TestCase
+has_capture_on_commit = hasattr(TestCase, 'captureOnCommitCallbacks')
+
+
+class BackgroundRenderTests(TestCase):
+    def setUp(self):
+        self._old_queue = fields.background_queue
+        fields.background_queue = tasks.InlineQueue()
+
+    def tearDown(self):
+        fields.background_queue = self._old_queue
+
+    def rendered_in_db(self, obj):
+        return BackgroundRender.objects.filter(pk=obj.pk).values_list(
+            '_body_rendered', flat=True).get()
+
+    @skipUnless(has_capture_on_commit,
+                'captureOnCommitCallbacks needs Django 3.2 or later')
+    def test_render_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            obj = BackgroundRender.objects.create(body='replace this text')
+            self.assertEqual(self.rendered_in_db(obj), tasks.PENDING)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self.rendered_in_db(obj), 'replacement text')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            obj = BackgroundRender.objects.get(pk=obj.pk)
+            obj.save()
+        self.assertEqual(callbacks, [])
+
+    @skipUnless(has_capture_on_commit,
+                'captureOnCommitCallbacks needs Django 3.2 or later')
+    def test_pending_read(self):
+        with self.captureOnCommitCallbacks():
+            obj = BackgroundRender.objects.create(body='replace this text')
+        obj = BackgroundRender.objects.get(pk=obj.pk)
+        self.assertEqual(str(obj.body), 'replacement text')
+        self.assertEqual(self.rendered_in_db(obj), tasks.PENDING)
+        # saving writes the rendering done on read
+        with self.captureOnCommitCallbacks() as callbacks:
+            obj.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.rendered_in_db(obj), 'replacement text')
+
+    @skipUnless(has_capture_on_commit,
+                'captureOnCommitCallbacks needs Django 3.2 or later')
+    def test_pending_save(self):
+        with self.captureOnCommitCallbacks():
+            obj = BackgroundRender.objects.create(body='replace this text')
+        with self.captureOnCommitCallbacks(execute=True):
+            BackgroundRender.objects.get(pk=obj.pk).save()
+        self.assertEqual(self.rendered_in_db(obj), 'replacement text')
+
+    def test_render_pending_skips_rendered_rows(self):
+        obj = BackgroundRender.objects.create(body='replace this text')
+        BackgroundRender.objects.filter(pk=obj.pk).update(
+            _body_rendered='done')
+        tasks.render_pending('tests.BackgroundRender', obj.pk, 'body',
+                             'default')
+        self.assertEqual(self.rendered_in_db(obj), 'done')
+
+    def test_thread_pool_queue(self):
+        calls = []
+        self._old_render_pending = tasks.render_pending
+        tasks.render_pending = lambda *args: calls.append(args)
+        try:
+            future = tasks.ThreadPoolQueue(1).enqueue(
+                'tests.BackgroundRender', 1, 'body', 'default')
+            future.result(5)
+        finally:
+            tasks.render_pending = self._old_render_pending
+        self.assertEqual(calls, [('tests.BackgroundRender', 1, 'body',
+                                  'default')])
+
+
+class AutocommitBackgroundRenderTests(TransactionTestCase):
+    """
+    Background renders of saves outside of ``atomic()``, where
+    ``on_commit`` callbacks run right away.
+
+    """
+    def setUp(self):
+        self._old_queue = fields.background_queue
+        fields.background_queue = tasks.InlineQueue()
+
+    def tearDown(self):
+        fields.background_queue = self._old_queue
+
+    def rendered_in_db(self, obj):
+        return BackgroundRender.objects.filter(pk=obj.pk).values_list(
+            '_body_rendered', flat=True).get()
+
+    def test_create(self):
+        obj = BackgroundRender(body='replace this text')
+        obj.save()
+        self.assertEqual(self.rendered_in_db(obj), 'replacement text')
+
+    def test_update(self):
+        obj = BackgroundRender.objects.create(body='replace this text')
+        obj.body = 'replace this other text'
+        obj.save()
+        self.assertEqual(self.rendered_in_db(obj), 'replacement other text')
+
+    def test_bulk_create(self):
+        objs = BackgroundRender.objects.bulk_create(
+            [BackgroundRender(body='replace this text')])
+        obj = BackgroundRender.objects.get()
+        self.assertEqual(self.rendered_in_db(obj), 'replacement text')
+        self.assertNotIn(fields._SAVING, objs[0].__dict__)
+
+    def test_receivers_per_model(self):
+        self.assertTrue(post_save.has_listeners(
+            BackgroundRender))
+        self.assertFalse(post_save.has_listeners(Post))
+
+
+class LazyFilterTests(TestCase):
+    def test_render_func_follows_setting(self):
+        with override_settings(
+                MARKITUP_FILTER=('tests.filter.testfilter_upper', {})):
+            self.assertIsNone(fields.render_func._func)
+            post = Post.objects.create(title='post', body='replace this')
+            self.assertEqual(post.body.rendered, 'REPLACE THIS')
+            self.assertIsNotNone(fields.render_func._func)
+        self.assertIsNone(fields.render_func._func)
+        post.save()
+        self.assertEqual(post.body.rendered, 'replacement')
+
+    def test_filter_func_follows_setting(self):
+        with override_settings(
+                MARKITUP_PREVIEW_FILTER=('tests.filter.testfilter_upper', {})):
+            self.assertEqual(markup.render_preview('replace this'),
+                             'REPLACE THIS')
+        self.assertEqual(markup.render_preview('replace this'),
+                         'replacement')
+
+    def test_memoized(self):
+        func = markup.get_filter_func()
+        self.assertIs(markup.get_filter_func(), func)
+        self.assertEqual(markup.filter_func('replace this'), 'replacement')
+        self.assertIs(markup.filter_func.get(), func)
+
+
+class NamedFilterTests(TestCase):
+    def test_field_filter(self):
+        obj = NamedFilter.objects.create(body='replace this')
+        self.assertEqual(obj.body.rendered, 'REPLACE THIS')
+        self.assertEqual(NamedFilter._meta.get_field('body').deconstruct()[3],
+                         {'no_rendered_field': True, 'filter': 'upper'})
+
+    def test_registry(self):
+        func = filters.get_filter('upper')
+        self.assertIs(filters.get_filter('upper'), func)
+        self.assertRaises(ImproperlyConfigured, filters.get_filter, 'nope')
+        with override_settings(MARKITUP_FILTERS={
+                'upper': ('tests.filter.testfilter', {'arg': 'x'})}):
+            self.assertEqual(filters.get_filter('upper')('replace this'), 'x')
+        self.assertEqual(filters.get_filter('upper')('replace this'),
+                         'REPLACE THIS')
+
+    def test_resolve_filter(self):
+        default = lambda: ('func', 'config')
+        self.assertEqual(filters.resolve_filter(None, default),
+                         ('func', 'config'))
+        self.assertEqual(filters.resolve_filter('upper', default),
+                         (filters.get_filter('upper'),
+                          filters.get_filter_config('upper')))
+
+    def test_imported_on_first_call(self):
+        with override_settings(MARKITUP_FILTERS={
+                'broken': ('tests.filter.nope', {})}):
+            func = filters.get_filter('broken')
+            self.assertRaises(ImproperlyConfigured, func, 'replace this')
+
+    def test_template_filter(self):
+        template = Template('{% load markitup_tags %}'
+                            '{{ content|render_markup:"upper" }}')
+        self.assertEqual(template.render(Context({'content': 'replace'})),
+                         'REPLACE')
+
+    def test_preview_view(self):
+        response = Client().post('/markitup/preview/?filter=upper',
+                                 {'data': 'replace this'})
+        self.assertContains(response, 'REPLACE THIS')
+        response = Client().post('/markitup/preview/',
+                                 {'data': 'replace this', 'filter': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_widget(self):
+        output = MarkItUpWidget(preview_filter='upper').render('name', 'value')
+        self.assertIn('data-preview-url="/markitup/preview/?filter=upper"',
+                      output)
+        field = NamedFilter._meta.get_field('body')
+        widget = field.formfield(widget=AdminMarkItUpWidget).widget
+        self.assertEqual(widget.attrs['data-preview-url'],
+                         '/markitup/preview/?filter=upper')
+
+
+class RenderSignalTests(TestCase):
+    def setUp(self):
+        self.renders = []
+        markup_rendered.connect(self.receiver)
+        self.addCleanup(markup_rendered.disconnect, self.receiver)
+
+    def receiver(self, sender, **kwargs):
+        kwargs.pop('signal')
+        self.renders.append(dict(kwargs, sender=sender))
+
+    def test_pre_save(self):
+        post = Post.objects.create(title='post', body='replace this text')
+        self.assertEqual(len(self.renders), 1)
+        render = self.renders[0]
+        self.assertEqual(render['sender'], 'pre_save')
+        self.assertEqual(render['filter'], 'tests.filter.testfilter')
+        self.assertEqual((render['input_size'], render['output_size']),
+                         (17, 16))
+        self.assertIs(render['instance'], post)
+        self.assertEqual(render['field_name'], 'body')
+        self.assertFalse(render['cache_hit'])
+        self.assertGreaterEqual(render['duration'], 0)
+
+    def test_cache_hit(self):
+        RenderOnRead(body='replace this').body.rendered
+        RenderOnRead(body='replace this').body.rendered
+        self.assertEqual([r['sender'] for r in self.renders],
+                         ['field', 'field'])
+        self.assertTrue(self.renders[1]['cache_hit'])
+
+    def test_render_markup_and_render_with(self):
+        Template('{% load markitup_tags %}{{ text|render_markup:"upper" }}'
+                 ).render(Context({'text': 'text'}))
+        Post(body='text').body.render_with('tests.filter.testfilter_upper')
+        self.assertEqual(
+            [(r['sender'], r['filter']) for r in self.renders],
+            [('render_markup', 'upper'),
+             ('render_with', 'tests.filter.testfilter_upper')])
+
+    def test_preview(self):
+        Client().post('/markitup/preview/', {'data': 'replace this'})
+        self.assertEqual([(r['sender'], r['output_size'])
+                          for r in self.renders], [('preview', 11)])
+
+    def test_streamed_preview(self):
+        settings.MARKITUP_PREVIEW_STREAM = True
+        try:
+            response = Client().post('/markitup/preview/',
+                                     {'data': 'replace this'})
+        finally:
+            settings.MARKITUP_PREVIEW_STREAM = False
+        b''.join(response.streaming_content)
+        self.assertEqual([(r['sender'], r['output_size'])
+                          for r in self.renders], [('preview', 11)])
+
+    def test_iterator_render(self):
+        def render(text):
+            for word in text.split():
+                yield '<p>%s</p>' % word
+        chunks = timed_render('preview', 'f', render, 'one two')
+        self.assertEqual(self.renders, [])
+        self.assertEqual(list(chunks), ['<p>one</p>', '<p>two</p>'])
+        self.assertEqual([(r['input_size'], r['output_size'])
+                          for r in self.renders], [(7, 20)])
+
+    def test_render_markup_lazy_string(self):
+        Template('{% load markitup_tags %}{{ text|render_markup }}'
+                 ).render(Context({'text': gettext_lazy('replace this')}))
+        self.assertEqual([(r['sender'], r['input_size'])
+                          for r in self.renders], [('render_markup', 12)])
+
+    def test_slow_render_log(self):
+        _old_threshold = settings.MARKITUP_SLOW_RENDER_THRESHOLD
+        settings.MARKITUP_SLOW_RENDER_THRESHOLD = 0
+        try:
+            with self.assertLogs('markitup.renders', 'WARNING') as logs:
+                post = Post.objects.create(title='post', body='text')
+                post.body = 'other text'
+                post.save()
+        finally:
+            settings.MARKITUP_SLOW_RENDER_THRESHOLD = _old_threshold
+        self.assertIn('Slow pre_save render of new tests.Post field body',
+                      logs.output[0])
+        self.assertIn('Slow pre_save render of tests.Post pk=%s field body'
+                      % post.pk, logs.output[1])
+
+
+class RenderStatsTests(SimpleTestCase):
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile([1, 2], 50), 1.5)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 100), 5)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary(self):
+        stats = RenderStats(size=3)
+        stats.connect()
+        self.addCleanup(stats.disconnect)
+        for duration in (4.0, 1.0, 2.0, 3.0):
+            markup_rendered.send(sender='preview', filter='f',
+                                 duration=duration, cache_hit=duration > 3)
+        self.assertEqual(stats.summary(ps=(0, 50)), {('preview', 'f'): {
+            'count': 4, 'cache_hits': 1, 'p0': 1.0, 'p50': 2.0}})
+        stats.reset()
+        self.assertEqual(stats.summary(), {})
+
+
+class RenderOnReadTests(TestCase):
+    def setUp(self):
+        self.field = RenderOnRead._meta.get_field('body')
+        self.field.render_cache.backend.clear()
+        self.field.render_cache.reset_stats()
+        self.obj = RenderOnRead.objects.create(body='replace this text')
+
+    def testNotRenderedOnSave(self):
+        self.assertEqual(self.field.render_cache.stats(),
+                         {'hits': 0, 'misses': 0})
+
+    def testRenderedOnRead(self):
+        obj = RenderOnRead.objects.get(pk=self.obj.pk)
+        self.assertEqual(obj.body.rendered, 'replacement text')
+        self.assertEqual(str(obj.body), 'replacement text')
+        self.assertEqual(self.field.render_cache.stats(),
+                         {'hits': 0, 'misses': 1})
+
+    def testSharedCache(self):
+        RenderOnRead.objects.get(pk=self.obj.pk).body.rendered
+        RenderOnRead.objects.get(pk=self.obj.pk).body.rendered
+        self.assertEqual(self.field.render_cache.stats(),
+                         {'hits': 1, 'misses': 1})
+
+    def testAssignInvalidatesRendered(self):
+        self.assertEqual(self.obj.body.rendered, 'replacement text')
+        self.obj.body = 'replace this again'
+        self.assertEqual(self.obj.body.rendered, 'replacement again')
+
+    def testNoRenderedFieldWithoutRenderOnRead(self):
+        obj = NoRendered.objects.create(body='replace this')
+        obj = NoRendered.objects.get(pk=obj.pk)
+        self.assertRaises(AttributeError, lambda: obj.body.rendered)
+
+
+class MarkupManagerTests(TestCase):
+    def testBulkCreate(self):
+        Article.objects.bulk_create([
+            Article(title='a', content='replace this', summary='replace this'),
+            Article(title='b', content='replace this too'),
+        ], batch_size=1)
+        a, b = Article.objects.order_by('title')
+        self.assertEqual(a.content.rendered, 'replacement')
+        self.assertEqual(a.summary.rendered, 'replacement')
+        self.assertEqual(b.content.rendered, 'replacement too')
+        self.assertEqual(b.summary.rendered, '')
+
+    def testBulkUpdate(self):
+        Article.objects.create(title='a', content='one')
+        Article.objects.create(title='b', content='two')
+        articles = list(Article.objects.order_by('title'))
+        for article in articles:
+            article.content = 'replace this %s' % article.title
+        with self.assertNumQueries(1):
+            Article.objects.bulk_update(articles, ['content'])
+        self.assertEqual(
+            [a.content.rendered for a in Article.objects.order_by('title')],
+            ['replacement a', 'replacement b'])
+
+    def testBulkUpdateOtherFields(self):
+        Article.objects.create(title='a', content='replace this')
+        articles = list(Article.objects.all())
+        articles[0].title = 'b'
+        Article.objects.bulk_update(articles, ['title'])
+        article = Article.objects.get()
+        self.assertEqual(article.title, 'b')
+        self.assertEqual(article.content.rendered, 'replacement')
+
+
+class RerenderMarkupCommandTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Post.objects.create(title='post %d' % i, body='replace this %d' % i)
+        Post.objects.update(_body_rendered='stale')
+
+    def rerender(self, *args, **kwargs):
+        out = StringIO()
+        call_command('rerender_markup', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def testRerender(self):
+        out = self.rerender('tests.Post', chunk_size=2)
+        self.assertEqual(
+            [p.body.rendered for p in Post.objects.order_by('pk')],
+            ['replacement %d' % i for i in range(5)])
+        self.assertIn('tests.Post: re-rendered 5 rows', out)
+        self.assertEqual(out.count('checkpoint pk'), 3)
+
+    def testRerenderApp(self):
+        Article.objects.create(title='a', content='replace this')
+        Article.objects.update(_content_rendered='stale')
+        out = self.rerender('tests')
+        self.assertIn('tests.Article: re-rendered 1 rows', out)
+        self.assertIn('tests.Post: re-rendered 5 rows', out)
+        self.assertEqual(Article.objects.get().content.rendered, 'replacement')
+
+    def testRerenderHiddenRows(self):
+        Published.objects.create(body='replace this')
+        Published._base_manager.update(_body_rendered='stale')
+        out = self.rerender('tests.Published')
+        self.assertIn('tests.Published: re-rendered 1 rows', out)
+        self.assertEqual(Published._base_manager.get().body.rendered,
+                         'replacement')
+
+    def testStartPk(self):
+        pks = list(Post.objects.order_by('pk').values_list('pk', flat=True))
+        self.rerender('tests.Post', start_pk=pks[2])
+        self.assertEqual(
+            [p.body.rendered for p in Post.objects.order_by('pk')],
+            ['stale', 'stale', 'stale', 'replacement 3', 'replacement 4'])
+
+    def testStartPkRequiresOneModel(self):
+        self.assertRaises(CommandError, self.rerender, 'tests', start_pk=1)
+
+
+class DeferRenderedTests(TestCase):
+    def setUp(self):
+        self.obj = DeferRendered.objects.create(body='replace this text')
+
+    def testRenderedIsDeferred(self):
+        obj = DeferRendered.objects.get(pk=self.obj.pk)
+        self.assertEqual(obj.get_deferred_fields(), {'_body_rendered'})
+        with self.assertNumQueries(1):
+            self.assertEqual(obj.body.rendered, 'replacement text')
+
+    def testSaveChangedRaw(self):
+        obj = DeferRendered.objects.get(pk=self.obj.pk)
+        obj.body = 'replace this other text'
+        obj.save()
+        self.assertEqual(DeferRendered.objects.get(pk=obj.pk).body.rendered,
+                         'replacement other text')
+
+    def testSaveUnchangedRaw(self):
+        obj = DeferRendered.objects.get(pk=self.obj.pk)
+        obj.body = obj.body.raw
+        obj.save()
+        self.assertEqual(DeferRendered.objects.get(pk=obj.pk).body.rendered,
+                         'replacement text')
+
+    def testRenderedOnly(self):
+        obj = DeferRendered.objects.rendered_only().get(pk=self.obj.pk)
+        self.assertEqual(obj.get_deferred_fields(), {'body'})
+        with self.assertNumQueries(0):
+            self.assertEqual(str(obj.body), 'replacement text')
+        with self.assertNumQueries(1):
+            self.assertEqual(obj.body.raw, 'replace this text')
+
+    def testRenderedOnlyWithOnly(self):
+        obj = DeferRendered.objects.only('pk').rendered_only().get(
+            pk=self.obj.pk)
+        self.assertEqual(obj.get_deferred_fields(), {'body'})
+
+    def testRenderedOnlySave(self):
+        obj = DeferRendered.objects.rendered_only().get(pk=self.obj.pk)
+        obj.save()
+        self.assertEqual(DeferRendered.objects.get(pk=obj.pk).body.raw,
+                         'replace this text')
+
 
 class MarkupFieldSerializationTests(TestCase):
     def setUp(self):
@@ -235,6 +901,498 @@ class PreviewTests(TestCase):
         self.assertTemplateUsed(response, 'markitup/preview.html')
 
 
+class FragmentPreviewTests(TestCase):
+    url = '/markitup/preview/fragment/'
+
+    def test_fragment(self):
+        response = Client().post(self.url, {'data': 'replace this text'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode('utf-8'), 'replacement text')
+        self.assertTemplateNotUsed(response, 'markitup/preview.html')
+
+    def test_json(self):
+        response = Client().post(self.url + '?format=json',
+                                 {'data': 'replace this text'})
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'html': 'replacement text'})
+
+    def test_named_filter(self):
+        response = Client().post(self.url + '?filter=upper',
+                                 {'data': 'replace this text'})
+        self.assertEqual(response.content.decode('utf-8'),
+                         'REPLACE THIS TEXT')
+        response = Client().post(self.url + '?filter=unknown',
+                                 {'data': 'replace this text'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed(self):
+        settings.MARKITUP_PREVIEW_STREAM = True
+        try:
+            response = Client().post(self.url, {'data': 'replace this text'})
+        finally:
+            settings.MARKITUP_PREVIEW_STREAM = False
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'replacement text')
+
+
+class StreamingPreviewTests(TestCase):
+    def setUp(self):
+        self._old_stream = settings.MARKITUP_PREVIEW_STREAM
+        self._old_chunk_size = settings.MARKITUP_PREVIEW_CHUNK_SIZE
+        self._old_filter_func = markup.filter_func
+        settings.MARKITUP_PREVIEW_STREAM = True
+        settings.MARKITUP_PREVIEW_CHUNK_SIZE = 4
+
+    def tearDown(self):
+        settings.MARKITUP_PREVIEW_STREAM = self._old_stream
+        settings.MARKITUP_PREVIEW_CHUNK_SIZE = self._old_chunk_size
+        markup.filter_func = self._old_filter_func
+
+    def post(self, data):
+        response = Client().post('/markitup/preview/', {'data': data})
+        self.assertTrue(response.streaming)
+        return [chunk.decode('utf-8') for chunk in response.streaming_content]
+
+    def test_streamed_preview(self):
+        chunks = self.post('replace this with something else')
+        self.assertIn('/static/markitup/preview.css', chunks[0])
+        self.assertNotIn('replacement', chunks[0])
+        self.assertIn('</html>', chunks[-1])
+        self.assertEqual(chunks[1:3], ['repl', 'acem'])
+        self.assertIn('replacement with something else', ''.join(chunks))
+
+    def test_iterable_filter(self):
+        def filter_func(text):
+            for word in text.split():
+                yield '<p>%s</p>' % word
+        markup.filter_func = filter_func
+        chunks = self.post('one two')
+        self.assertEqual(chunks[1:3], ['<p>one</p>', '<p>two</p>'])
+
+    def test_max_size(self):
+        _old_max_size = settings.MARKITUP_PREVIEW_MAX_SIZE
+        settings.MARKITUP_PREVIEW_MAX_SIZE = 10
+        try:
+            response = Client().post('/markitup/preview/',
+                                     {'data': 'replace this with something'})
+            self.assertEqual(response.status_code, 413)
+        finally:
+            settings.MARKITUP_PREVIEW_MAX_SIZE = _old_max_size
+
+
+class ProcessPoolBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = ProcessPoolBackend(processes=1, queue_size=1,
+                                          timeout=0.5)
+        self.addCleanup(self.backend.shutdown)
+
+    def test_render(self):
+        func = self.backend.wrap(None, 'tests.filter.testfilter',
+                                 {'arg': 'replacement'})
+        self.assertEqual(func('replace this text'), 'replacement text')
+        self.assertEqual(self.backend.filter_paths,
+                         {'tests.filter.testfilter'})
+
+    def test_timeout(self):
+        func = self.backend.wrap(None, 'tests.filter.testfilter_slow')
+        self.assertEqual(func('text'), 'text')
+        self.assertRaises(RenderTimeout, func, 'text', seconds=2)
+        # the timed out render still holds the only slot
+        self.assertRaises(RenderQueueFull, func, 'text')
+
+    def test_preview_view(self):
+        old_filter_func = markup.filter_func
+        self.addCleanup(setattr, markup, 'filter_func', old_filter_func)
+        markup.filter_func = self.backend.wrap(
+            None, 'tests.filter.testfilter_slow', {'seconds': 2})
+        response = Client().post('/markitup/preview/', {'data': 'text'})
+        self.assertEqual(response.status_code, 504)
+        response = Client().post('/markitup/preview/', {'data': 'text'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_streamed_preview_view(self):
+        old_filter_func = markup.filter_func
+        self.addCleanup(setattr, markup, 'filter_func', old_filter_func)
+        markup.filter_func = self.backend.wrap(
+            None, 'tests.filter.testfilter_slow', {'seconds': 2})
+        settings.MARKITUP_PREVIEW_STREAM = True
+        self.addCleanup(setattr, settings, 'MARKITUP_PREVIEW_STREAM', False)
+        for url, status in (('/markitup/preview/', 504),
+                            ('/markitup/preview/fragment/', 503)):
+            response = Client().post(url, {'data': 'text'})
+            self.assertFalse(response.streaming)
+            self.assertEqual(response.status_code, status)
+
+
+class SplitBlocksTests(SimpleTestCase):
+    def test_split_blocks(self):
+        text = ('# Title\n\npara one\nline\n\n- a\n\n    more\n\n- b\n\n'
+                '```\ncode\n\ncode\n```\n\n> q\n\n> q2\n\nend\n')
+        self.assertEqual(blocks.split_blocks(text), [
+            '# Title', 'para one\nline', '- a\n\n    more\n\n- b',
+            '```\ncode\n\ncode\n```', '> q\n\n> q2', 'end'])
+
+    def test_blank_lines_kept(self):
+        text = 'Some text\n\n    code\n\n\n\n    more code\n  \nend'
+        self.assertEqual(blocks.split_blocks(text), [
+            'Some text\n\n    code\n\n\n\n    more code', 'end'])
+
+    @skipUnless(has_markdown, 'markdown is not installed')
+    def test_render_indented_code(self):
+        text = 'Some text\n\n    code\n\n\n\n    more code\n\nend'
+        renderer = blocks.BlockRenderer(markdown.markdown,
+                                        'markdown.markdown')
+        self.assertEqual(renderer(text), markdown.markdown(text))
+
+    def test_cross_block_constructs(self):
+        text = 'a [link][1]\n\n[1]: http://example.com/\n'
+        self.assertEqual(blocks.split_blocks(text), [text])
+
+
+class BlockRendererTests(SimpleTestCase):
+    def setUp(self):
+        self.rendered = []
+        self.cache = get_render_cache('local')
+
+    def filter_func(self, text):
+        self.rendered.append(text)
+        return '<p>%s</p>' % text.upper()
+
+    def test_render_blocks(self):
+        renderer = blocks.BlockRenderer(self.filter_func,
+                                        'markdown.markdown', cache=self.cache)
+        self.assertEqual(renderer('one\n\ntwo'), '<p>ONE</p>\n<p>TWO</p>')
+        self.assertEqual(renderer('one\n\nthree'),
+                         '<p>ONE</p>\n<p>THREE</p>')
+        self.assertEqual(self.rendered, ['one', 'two', 'three'])
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 3})
+
+    def test_long_document(self):
+        cache = blocks.block_cache
+        cache.backend.clear()
+        cache.reset_stats()
+        renderer = blocks.BlockRenderer(self.filter_func,
+                                        'markdown.markdown', cache=cache)
+        paragraphs = ['paragraph %d' % i for i in range(400)]
+        renderer('\n\n'.join(paragraphs))
+        paragraphs[200] = 'edited'
+        cache.reset_stats()
+        renderer('\n\n'.join(paragraphs))
+        self.assertEqual(cache.stats(), {'hits': 399, 'misses': 1})
+
+    def test_more_blocks_than_cache_entries(self):
+        cache = get_render_cache('local', max_entries=2)
+        renderer = blocks.BlockRenderer(self.filter_func,
+                                        'markdown.markdown', cache=cache)
+        self.assertEqual(renderer('one\n\ntwo\n\nthree'),
+                         '<p>ONE\n\nTWO\n\nTHREE</p>')
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_unknown_syntax(self):
+        func = self.filter_func
+        self.assertRaises(ValueError, blocks.BlockRenderer, func,
+                          'tests.filter.testfilter')
+        settings.MARKITUP_RENDER_BLOCKS = True
+        try:
+            self.assertIs(blocks.get_block_renderer(
+                func, 'tests.filter.testfilter'), func)
+            self.assertIsInstance(blocks.get_block_renderer(
+                func, 'markdown.markdown'), blocks.BlockRenderer)
+        finally:
+            settings.MARKITUP_RENDER_BLOCKS = False
+
+    @skipUnless(has_markdown, 'markdown is not installed')
+    def test_stateful_extensions(self):
+        text = '# H\n\ntext\n\n# H\n\ntext'
+        for extensions in (['toc'], ['markdown.extensions.toc'],
+                           ['markdown.extensions.extra']):
+            kwargs = {'extensions': extensions}
+            func = partial(markdown.markdown, **kwargs)
+            settings.MARKITUP_RENDER_BLOCKS = True
+            try:
+                renderer = blocks.get_block_renderer(
+                    func, 'markdown.markdown', kwargs)
+            finally:
+                settings.MARKITUP_RENDER_BLOCKS = False
+            self.assertEqual(renderer(text), markdown.markdown(text, **kwargs))
+        self.assertIn('id="h_1"', markdown.markdown(text, extensions=['toc']))
+        from markdown.extensions.toc import TocExtension
+        self.assertIsNone(blocks.get_syntax('markdown.markdown', {
+            'extensions': [TocExtension()]}))
+        self.assertIsNotNone(blocks.get_syntax('markdown.markdown', {
+            'extensions': ['markdown.extensions.tables']}))
+
+    def test_single_block(self):
+        renderer = blocks.BlockRenderer(self.filter_func,
+                                        'markdown.markdown', cache=self.cache)
+        self.assertEqual(renderer('[a][1]\n\n[1]: /a'), '<p>[A][1]\n\n[1]: /A</p>')
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_split_sections(self):
+        text = ('Intro.\n\nA\n=\n\na\n\nSub\n---\n\nsub\n\n'
+                'B\n=\n\nb\n')
+        self.assertEqual(blocks.split_sections(text), [
+            'Intro.', 'A\n=\n\na\n\nSub\n---\n\nsub', 'B\n=\n\nb'])
+
+    def test_split_sections_fallback(self):
+        for text in ('A\n=\n\nsee B_\n\nB\n=\n\nb\n',
+                     'A\n=\n\na\n\nA\n=\n\na\n',
+                     'A\n=\n\nSub\n---\n\nB\n=\n\nSub2\n~~~~\n'):
+            self.assertEqual(blocks.split_sections(text), [text])
+
+    @skipUnless(renderers_has_rest, 'docutils is not installed')
+    def test_render_rest(self):
+        from markitup.renderers import render_rest
+        text = 'Intro.\n\nA\n=\n\na\n\nSub\n---\n\nsub\n\nB\n=\n\nb\n'
+        renderer = blocks.BlockRenderer(render_rest, blocks.REST_FILTER,
+                                        cache=self.cache)
+        self.assertEqual(renderer(text), render_rest(text))
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 3})
+
+
+@skipUnless(renderers_has_rest, 'docutils is not installed')
+class RenderRestTests(TestCase):
+    text = ('Title\n=====\n\nSome *text* and a `link <http://example.com/>`_.'
+            '\n\n.. raw:: html\n\n   <script>alert(1)</script>\n')
+
+    def publish_parts(self, text, **overrides):
+        from docutils.core import publish_parts
+        overrides.update(raw_enabled=False, file_insertion_enabled=False,
+                         warning_stream=False)
+        return publish_parts(source=text, writer_name='html4css1',
+                             settings_overrides=overrides)
+
+    def test_html_body(self):
+        expected = self.publish_parts(self.text)['html_body']
+        self.assertEqual(renderers.render_rest(self.text, warning_stream=False),
+                         expected)
+        self.assertNotIn('<script>', expected)
+        # again with the reused publisher
+        self.assertEqual(renderers.render_rest(self.text, warning_stream=False),
+                         expected)
+
+    def test_fragment(self):
+        self.assertEqual(
+            renderers.render_rest(self.text, fragment=True, warning_stream=False),
+            self.publish_parts(self.text)['fragment'])
+
+    def test_settings(self):
+        text = 'Title\n=====\n\nSection\n-------\n\ntext\n'
+        self.assertEqual(
+            renderers.render_rest(text, initial_header_level=3, doctitle_xform=False),
+            self.publish_parts(text, initial_header_level=3,
+                               doctitle_xform=False)['html_body'])
+        self.assertEqual(renderers.render_rest(text),
+                         self.publish_parts(text)['html_body'])
+
+    def test_publisher_reused(self):
+        publisher = renderers._get_publisher('html_body', {})
+        self.assertIs(renderers._get_publisher('html_body', {}), publisher)
+        self.assertIsNot(renderers._get_publisher('fragment', {}), publisher)
+        self.assertIsNot(
+            renderers._get_publisher('html_body', {'tab_width': 4}),
+            publisher)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(
+            renderers._get_publisher('html_body', {})))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], publisher)
+
+    def test_unhashable_settings(self):
+        self.assertIn('<em>text</em>',
+                      renderers.render_rest('*text*', strip_classes=['x']))
+
+
+@skipUnless(has_markdown, 'markdown is not installed')
+class BlockPreviewTests(TestCase):
+    url = '/markitup/preview/blocks/'
+
+    def setUp(self):
+        override = override_settings(
+            MARKITUP_PREVIEW_FILTER=('markdown.markdown', {}))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def post(self, data, status=200):
+        response = Client().post(self.url, data)
+        self.assertEqual(response.status_code, status)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_full_request(self):
+        result = self.post({'data': 'block one\n\nblock two'})
+        self.assertEqual(len(result['blocks']), 2)
+        self.assertIn('<div class="markitup-blocks">', result['page'])
+        self.assertIn('data-block="%s"><p>block one</p></div>'
+                      % result['blocks'][0], result['page'])
+        self.assertNotIn('html', result)
+
+    def test_delta(self):
+        first = self.post({'data': 'block one\n\nblock two'})
+        result = self.post({'base': first['revision'],
+                            'delta': json.dumps([17, 20, 'three'])})
+        self.assertEqual(result['blocks'][0], first['blocks'][0])
+        self.assertNotEqual(result['blocks'][1], first['blocks'][1])
+        self.assertEqual(result['html'],
+                         {result['blocks'][1]: '<p>block three</p>'})
+        self.assertEqual(result['revision'], self.post(
+            {'data': 'block one\n\nblock three'})['revision'])
+
+    def test_other_filter_single_block(self):
+        with override_settings(MARKITUP_PREVIEW_FILTER=(
+                'tests.filter.testfilter', {'arg': 'replacement'})):
+            result = self.post({'data': 'replace this one\n\nreplace this two'})
+        self.assertEqual(len(result['blocks']), 1)
+        self.assertIn('>replacement one\n\nreplacement two</div>',
+                      result['page'])
+
+    @skipUnless(renderers_has_rest, 'docutils is not installed')
+    def test_rest_sections(self):
+        data = 'Title\n=====\n\nText one.\n\nOther\n=====\n\nText two.'
+        with override_settings(MARKITUP_PREVIEW_FILTER=(
+                'markitup.renderers.render_rest', {})):
+            result = self.post({'data': data})
+            second = self.post({'base': result['revision'],
+                                'delta': json.dumps([42, 45, 'three'])})
+        self.assertEqual(len(result['blocks']), 2)
+        # each section keeps its title, in one document
+        self.assertEqual(result['page'].count('<div class="document">'), 1)
+        self.assertIn('<h1>Title</h1>', result['page'])
+        self.assertIn('<h1>Other</h1>', result['page'])
+        html = second['html'][second['blocks'][1]]
+        self.assertTrue(html.startswith('<div class="section" id="other">'))
+        self.assertIn('Text three.', html)
+
+    def test_unknown_base(self):
+        self.post({'base': 'unknown', 'delta': '[0, 0, ""]'}, status=409)
+
+    def test_invalid_delta(self):
+        first = self.post({'data': 'text'})
+        for delta in ('', '[0, 10, ""]', '[2, 1, ""]', '[0, 0]'):
+            response = Client().post(self.url, {'base': first['revision'],
+                                                'delta': delta})
+            self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(AsyncRequestFactory, 'async views need Django 3.1 or later')
+class AsyncPreviewTests(SimpleTestCase):
+    def setUp(self):
+        self._old_timeout = settings.MARKITUP_PREVIEW_TIMEOUT
+        self._old_concurrency = settings.MARKITUP_PREVIEW_CONCURRENCY
+        self._old_filter_func = markup.filter_func
+
+    def tearDown(self):
+        settings.MARKITUP_PREVIEW_TIMEOUT = self._old_timeout
+        settings.MARKITUP_PREVIEW_CONCURRENCY = self._old_concurrency
+        markup.filter_func = self._old_filter_func
+
+    def request(self, data):
+        request = AsyncRequestFactory().post(
+            '/markitup/preview/', urlencode({'data': data}),
+            content_type='application/x-www-form-urlencoded')
+        return views.apply_filter_async(request)
+
+    def slow_filter(self, text):
+        time.sleep(0.3)
+        return text
+
+    async def test_preview(self):
+        response = await self.request('replace this with something else')
+        self.assertContains(response, 'replacement with something else',
+                            status_code=200)
+
+    async def test_timeout(self):
+        settings.MARKITUP_PREVIEW_TIMEOUT = 0.1
+        markup.filter_func = self.slow_filter
+        response = await self.request('text')
+        self.assertEqual(response.status_code, 504)
+
+    async def test_concurrency_limit(self):
+        settings.MARKITUP_PREVIEW_TIMEOUT = 0.1
+        settings.MARKITUP_PREVIEW_CONCURRENCY = 1
+        markup.filter_func = self.slow_filter
+        responses = await asyncio.gather(self.request('one'),
+                                         self.request('two'))
+        self.assertEqual(sorted(r.status_code for r in responses),
+                         [503, 504])
+
+
+class PreviewCacheTests(TestCase):
+    def setUp(self):
+        self._old_cache = markup.preview_cache
+        markup.preview_cache = get_render_cache('local')
+
+    def tearDown(self):
+        markup.preview_cache = self._old_cache
+
+    def test_repeated_preview_hits_cache(self):
+        c = Client()
+        for i in range(3):
+            response = c.post('/markitup/preview/',
+                              {'data': 'replace this with something else'})
+            self.assertContains(response, 'replacement with something else')
+        self.assertEqual(markup.preview_cache.stats(),
+                         {'hits': 2, 'misses': 1})
+
+    def test_changed_text_misses_cache(self):
+        c = Client()
+        c.post('/markitup/preview/', {'data': 'replace this'})
+        c.post('/markitup/preview/', {'data': 'replace this again'})
+        self.assertEqual(markup.preview_cache.stats(),
+                         {'hits': 0, 'misses': 2})
+
+
+class RenderCacheTests(TestCase):
+    def test_key_depends_on_filter(self):
+        self.assertNotEqual(render_key('text', 'a.filter', {'x': 1}),
+                            render_key('text', 'a.filter', {'x': 2}))
+        self.assertNotEqual(render_key('text', 'a.filter'),
+                            render_key('text', 'b.filter'))
+        self.assertEqual(render_key('text', 'a.filter', {'x': 1, 'y': 2}),
+                         render_key('text', 'a.filter', {'y': 2, 'x': 1}))
+
+    def test_local_cache_evicts_least_recently_used(self):
+        cache = LocalCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_local_cache_expires_entries(self):
+        cache = LocalCache(max_entries=2, timeout=-1)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_django_cache_alias(self):
+        cache = get_render_cache('default')
+        key = render_key('replace this', 'tests.filter.testfilter')
+        render = lambda text: text.upper()
+        caches['default'].delete(key)
+        self.assertEqual(cache.render(render, 'replace this', key),
+                         'REPLACE THIS')
+        self.assertEqual(cache.render(render, 'replace this', key),
+                         'REPLACE THIS')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_concurrent_stats(self):
+        cache = RenderCache(LocalCache(max_entries=10))
+        render = lambda text: text.upper()
+
+        def render_many(n):
+            for i in range(1000):
+                cache.render(render, 'text', str(i % 20))
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(render_many, range(4)))
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 4000)
+
+
 class MIUTestCase(TestCase):
     def assertIn(self, needle, haystack, reverse=False):
         func = reverse and self.failIf or self.failUnless
@@ -260,6 +1418,38 @@ class TemplatefilterTests(MIUTestCase):
                                                   'replace this text'}))
 
 
+class CachedTemplatefilterTests(MIUTestCase):
+    tpl_string = "{% load markitup_tags %}{{ content|render_markup_cached }}"
+
+    def setUp(self):
+        self._old_cache = markitup_tags.render_cache
+        markitup_tags.render_cache = get_render_cache('local')
+
+    def tearDown(self):
+        markitup_tags.render_cache = self._old_cache
+
+    def test_render_markup_cached(self):
+        for i in range(3):
+            self.assertEqual('replacement text',
+                             self.render(self.tpl_string,
+                                         {'content': 'replace this text'}))
+        self.assertEqual(markitup_tags.render_cache.stats(),
+                         {'hits': 2, 'misses': 1})
+
+    def test_max_entry_size(self):
+        markitup_tags.render_cache.max_entry_size = 10
+        for i in range(2):
+            self.render(self.tpl_string, {'content': 'replace this text'})
+        self.assertEqual(markitup_tags.render_cache.stats(),
+                         {'hits': 0, 'misses': 2})
+
+    def test_default_cache(self):
+        markitup_tags.render_cache = self._old_cache
+        self.assertEqual('replacement text',
+                         self.render(self.tpl_string,
+                                     {'content': 'replace this text'}))
+
+
 class RenderTestMixin(object):
     look_for = 'OVERRIDE ME'
     look_for_auto_preview = 'data-auto-preview="1"'
@@ -294,6 +1484,38 @@ class RenderTestMixin(object):
                       self.render_subject(False),
                       reverse=True)
 
+    def test_preview_refresh_settings(self):
+        output = self.render_subject()
+        self.assertIn('data-preview-debounce="300"', output)
+        self.assertIn('data-preview-throttle="0"', output)
+
+    def test_preview_blocks_setting(self):
+        self.assertNotIn('data-preview-blocks-url', self.render_subject())
+        settings.MARKITUP_PREVIEW_BLOCKS = True
+        try:
+            self.assertIn('data-preview-blocks-url="/markitup/preview/blocks/"',
+                          self.render_subject())
+        finally:
+            settings.MARKITUP_PREVIEW_BLOCKS = False
+
+    def test_preview_fragments_setting(self):
+        self.assertNotIn('data-preview-fragment-url', self.render_subject())
+        settings.MARKITUP_PREVIEW_FRAGMENTS = True
+        try:
+            self.assertIn(
+                'data-preview-fragment-url="/markitup/preview/fragment/"',
+                self.render_subject())
+        finally:
+            settings.MARKITUP_PREVIEW_FRAGMENTS = False
+
+    def test_lazy_setting(self):
+        self.assertNotIn('data-lazy', self.render_subject())
+        settings.MARKITUP_LAZY = True
+        try:
+            self.assertIn('data-lazy="1"', self.render_subject())
+        finally:
+            settings.MARKITUP_LAZY = False
+
 
 class RenderTemplateTagTests(RenderTestMixin, MIUTestCase):
     look_for = 'data-element="#my_id"'
@@ -317,6 +1539,22 @@ class RenderWidgetTests(RenderTestMixin, MIUTestCase):
         widget = MarkItUpWidget(auto_preview=auto_preview)
         return widget.render('name', 'value')
 
+    def test_preview_refresh_arguments(self):
+        widget = MarkItUpWidget(preview_debounce=500, preview_throttle=1000)
+        output = widget.render('name', 'value')
+        self.assertIn('data-preview-debounce="500"', output)
+        self.assertIn('data-preview-throttle="1000"', output)
+
+    def test_lazy_argument(self):
+        self.assertIn('data-lazy="1"',
+                      MarkItUpWidget(lazy=True).render('name', 'value'))
+        settings.MARKITUP_LAZY = True
+        try:
+            self.assertNotIn('data-lazy', MarkItUpWidget(
+                lazy=False).render('name', 'value'))
+        finally:
+            settings.MARKITUP_LAZY = False
+
 
 class TemplatetagMediaUrlTests(MIUTestCase):
     maxDiff = None
@@ -499,3 +1737,101 @@ class WidgetMediaUrlTests(TemplatetagMediaUrlTests):
                 self.assertIn(link, self._get_js())
             else:
                 self.assertNotIn('src=""', self._get_js())
+
+    def test_media_memoized(self):
+        media = self._get_media_obj()
+        self.assertIs(self._get_media_obj(), media)
+        self.assertIsNot(self._get_media_obj(markitup_set='some/path'), media)
+        with override_settings(STATIC_URL='/other/'):
+            self.assertIn('/other/markitup/jquery.markitup.js',
+                          str(self._get_media_obj()))
+        self.assertIsNot(self._get_media_obj(), media)
+        self.assertEqual(str(self._get_media_obj()), str(media))
+
+
+class BundleTests(MIUTestCase):
+    def setUp(self):
+        self._old_bundle = settings.MARKITUP_BUNDLE
+        settings.MARKITUP_BUNDLE = True
+
+    def tearDown(self):
+        settings.MARKITUP_BUNDLE = self._old_bundle
+
+    def get(self, url, status=200, **headers):
+        response = Client().get(url, **headers)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_widget_media(self):
+        media = MarkItUpWidget().media
+        js_url, css_url = bundle.bundle_urls(settings.MARKITUP_SET,
+                                             settings.MARKITUP_SKIN)
+        self.assertEqual(media._js, [settings.JQUERY_URL, js_url])
+        self.assertEqual(media._css, {'screen': [css_url]})
+        self.assertTrue(js_url.startswith('/markitup/bundle/'))
+
+    def test_templatetags(self):
+        js_url, css_url = bundle.bundle_urls(settings.MARKITUP_SET,
+                                             settings.MARKITUP_SKIN)
+        out = self.render("{% load markitup_tags %}{% markitup_media %}")
+        self.assertIn(escape(js_url), out)
+        self.assertIn(escape(css_url), out)
+        self.assertNotIn('jquery.markitup.js', out)
+
+    def test_js(self):
+        js_url, css_url = bundle.bundle_urls(settings.MARKITUP_SET,
+                                             settings.MARKITUP_SKIN)
+        response = self.get(js_url)
+        content = response.content.decode('utf-8')
+        self.assertEqual(response['Content-Type'],
+                         'text/javascript; charset=utf-8')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        for name in ('ajax_csrf.js', 'jquery.markitup.js',
+                     'django-markitup.js'):
+            self.assertIn(_read_static('markitup/' + name), content)
+        self.assertIn(_read_static('markitup/sets/default/set.js'), content)
+        self.assertIn('mySettings.root = "/static/markitup/"', content)
+
+    def test_css(self):
+        js_url, css_url = bundle.bundle_urls('markitup/sets/markdown/',
+                                             'markitup/skins/markitup/')
+        content = self.get(css_url).content.decode('utf-8')
+        self.assertIn(
+            'url("/static/markitup/skins/markitup/images/bg-container.png")',
+            content)
+        self.assertIn(
+            'url("/static/markitup/sets/markdown/images/bold.png")', content)
+
+    def test_gzip(self):
+        js_url, css_url = bundle.bundle_urls(settings.MARKITUP_SET,
+                                             settings.MARKITUP_SKIN)
+        plain = self.get(css_url).content
+        response = self.get(css_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+    def test_gzip_reproducible(self):
+        compressed = bundle.Bundle('body { color: red; }', 'text/css').gzip
+        # no modification time in the gzip header
+        self.assertEqual(compressed[4:8], b'\0\0\0\0')
+        self.assertEqual(gzip.decompress(compressed), b'body { color: red; }')
+
+    def test_not_found(self):
+        js_url, css_url = bundle.bundle_urls(settings.MARKITUP_SET,
+                                             settings.MARKITUP_SKIN)
+        self.get(js_url.replace('/bundle/', '/bundle/0'), status=404)
+        self.get(css_url.replace('skin=', 'skin=..%2F'), status=404)
+        self.get(js_url.replace('set=', 'set=missing%2F'), status=404)
+
+    def test_not_bundled(self):
+        media = MarkItUpWidget(markitup_set='/some/path').media
+        self.assertIn('/some/path/set.js', media._js)
+        self.assertIsNone(bundle.bundle_urls('markitup/sets/missing',
+                                             settings.MARKITUP_SKIN))
+
+
+def _read_static(path):
+    from django.contrib.staticfiles import finders
+    with open(finders.find(path)) as f:
+        return f.read()